@@ -0,0 +1,167 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pydub import AudioSegment
+
+from edits import Source
+from export import ExportJob, format_of, parse_targets
+from loudness import normalize as normalize_node
+from merge import merge as merge_nodes
+from seekindex import SeekIndex
+from silence import detect_segments
+from streaming import RANGE_DECODE_MS
+
+# Job spec, e.g.
+# {
+#     "inputs": ["recordings/*.mp3"],
+#     "operations": [["cut", 0, 60000], ["speed", 1.5], ["frequency", 22050], ["volume", -3], ["merge", "outro.mp3", 500],
+#                    ["normalize", -14, -1], ["split", -40, 500, 100]],
+#     "output": "out/{stem}.mp3",
+#     "formats": "mp3:192k, ogg"
+# }
+# Times are in milliseconds and volume changes in dB, as in the editors; merge takes
+# an optional crossfade and normalize a target in LUFS and an optional peak limit in dBFS.
+# split cuts at silences (threshold in dBFS, shortest silence and silence kept around
+# each part in ms); the operations after it apply to each part, and each part is
+# written to its own file, numbered after the input's stem.
+
+
+def cut(node, start, end):
+    return node[start:end]
+
+
+def merge(node, path, crossfade_ms=0):
+    return merge_nodes([node, load(path)], crossfade_ms)
+
+
+def speed(node, value):
+    return node.speedup(playback_speed=value)
+
+
+def frequency(node, value):
+    return node.set_frame_rate(int(value))
+
+
+def volume(node, value):
+    return node + value
+
+
+def normalize(node, target=-14.0, peak_limit=None):
+    return normalize_node(node, target, peak_limit)
+
+
+def split(node, silence_thresh=-40, min_silence_len=500, keep_silence=100):
+    return [node[start:end] for start, end in detect_segments(node, min_silence_len, silence_thresh, keep_silence)]
+
+
+OPERATIONS = {"cut": cut, "merge": merge, "speed": speed, "frequency": frequency, "volume": volume,
+              "normalize": normalize, "split": split}
+
+
+def load(path):
+    return Source.from_segment(AudioSegment.from_file(path))
+
+
+def open_input(path, operations):
+    # A leading cut of an MP3 decodes only the frames it covers: a short one at once, a
+    # longer one as it is streamed, so it is never held in memory whole. Returns the
+    # node and the operations left.
+    if operations and operations[0][0] == "cut" and format_of(path) == "mp3":
+        _, start, end = operations[0]
+        index = SeekIndex.build(path)
+        if end - start > RANGE_DECODE_MS:
+            return index.node()[start:end], operations[1:]
+        return index.source(start, end), operations[1:]
+    return load(path), operations
+
+
+def apply_operations(node, operations):
+    # The edited nodes: one, or one per part once the audio has been split
+    nodes = [node]
+    for name, *args in operations:
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation: {name}")
+        results = [OPERATIONS[name](node, *args) for node in nodes]
+        nodes = [part for result in results for part in (result if isinstance(result, list) else [result])]
+    return nodes
+
+
+def output_targets(path, spec, part=None):
+    stem, extension = os.path.splitext(os.path.basename(path))
+    if part is not None:
+        stem = f"{stem}_{part + 1:03d}"
+    output = spec.get("output", "{dir}/{stem}_edited{ext}").format(
+        dir=os.path.dirname(path) or ".", stem=stem, ext=extension)
+    if spec.get("formats"):
+        return parse_targets(output, spec["formats"])
+    return [(output, format_of(output), None)]
+
+
+def process_file(path, spec):
+    # Runs in a worker process; returns (path, seconds of audio written, wall seconds, error)
+    started = time.perf_counter()
+    try:
+        operations = spec.get("operations", [])
+        nodes = apply_operations(*open_input(path, operations))
+        split = any(name == "split" for name, *_ in operations)
+        for part, node in enumerate(nodes):
+            targets = output_targets(path, spec, part if split else None)
+            for output, _, _ in targets:
+                os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+            job = ExportJob(node, targets)
+            job.run()
+            if job.error is not None:
+                raise job.error
+        return path, sum(len(node) for node in nodes) / 1000, time.perf_counter() - started, None
+    except Exception as e:
+        return path, 0, time.perf_counter() - started, str(e)
+
+
+def expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(os.path.expanduser(pattern), recursive=True)))
+    return list(dict.fromkeys(paths))
+
+
+def run(spec, workers=None):
+    paths = expand_inputs(spec["inputs"])
+    if not paths:
+        print("No input files matched.")
+        return 1
+    started = time.perf_counter()
+    total_audio = 0
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers or spec.get("workers")) as pool:
+        futures = [pool.submit(process_file, path, spec) for path in paths]
+        for future in as_completed(futures):
+            path, audio, wall, error = future.result()
+            if error:
+                failures += 1
+                print(f"{path}: failed: {error}")
+                continue
+            total_audio += audio
+            print(f"{path}: {audio:.1f} s of audio in {wall:.2f} s ({audio / max(wall, 1e-9):.1f}x real time)")
+    elapsed = time.perf_counter() - started
+    print(f"{len(paths) - failures}/{len(paths)} files, {total_audio:.1f} s of audio in {elapsed:.2f} s "
+          f"({total_audio / max(elapsed, 1e-9):.1f}x real time, {len(paths) / max(elapsed, 1e-9):.2f} files/s)")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply an edit chain to many audio files without the editor.")
+    parser.add_argument("spec", help="JSON job spec file")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    args = parser.parse_args(argv)
+    with open(args.spec) as f:
+        spec = json.load(f)
+    return run(spec, args.workers)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from pydub import AudioSegment
+
+from cache import DecodeCache
+from edits import Source
+from export import ExportJob
+from loudness import measure as measure_loudness
+from seekindex import SeekIndex, is_mp3
+from tracing import max_rss_bytes
+from waveform import WaveformView
+
+SAMPLES = ["new1.mp3", "new2.mp3", "new3.mp3", "ramr.mp3", "sir.mp3", "new_sound.mp3"]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def synthetic(seconds, frame_rate=44100, channels=2, seed=0):
+    # Deterministic tone plus noise, long enough to show how each path scales
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    tone = 0.3 * np.sin(2 * np.pi * 440 * t)[:, None] + 0.05 * rng.standard_normal((len(t), channels))
+    samples = (np.clip(tone, -1, 1) * 32767).astype(np.int16)
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=frame_rate, channels=channels)
+
+
+def drain(node):
+    # Edits are lazy; pulling every block is what the editor pays for on playback or export
+    for _ in node.stream(0, 65536):
+        pass
+
+
+def draw(node):
+    figure = Figure(figsize=(5, 4), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    WaveformView(figure).show(node)
+    canvas.draw()
+
+
+def peak_rss_mb():
+    return max_rss_bytes() / 1024 ** 2
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return peak_rss_mb()
+
+
+def measure(function, repeat):
+    before = rss_mb()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat,
+            "peak_rss_mb": peak_rss_mb(), "rss_growth_mb": max(0.0, peak_rss_mb() - before)}
+
+
+def isolated(function, repeat):
+    # Each case runs in a forked child so its peak RSS is its own rather than the
+    # highest seen by any earlier case. Without fork (Windows) it runs in this process,
+    # and peak RSS is the highest so far.
+    if not hasattr(os, "fork"):
+        try:
+            return measure(function, repeat)
+        except Exception as e:
+            return {"error": str(e)}
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            result = measure(function, repeat)
+        except Exception as e:
+            result = {"error": str(e)}
+        with os.fdopen(write, "w") as f:
+            json.dump(result, f)
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    return json.loads(data) if data else {"error": "benchmark process died"}
+
+
+def once(function):
+    # Calls `function` the first time the result is wanted and keeps it for later calls
+    results = []
+
+    def get():
+        if not results:
+            results.append(function())
+        return results[0]
+    return get
+
+
+def synthetic_file(path, seconds):
+    synthetic(seconds).export(path, format="wav")
+    return path
+
+
+def cases(inputs, directory):
+    # (name, setup, function) triples; each input gets every hot path of the editor.
+    # setup is only called for the cases that are run, untimed and before the case is
+    # forked, and its result is passed to function. Setups are shared between cases.
+    # Importing an editor is what its window waits for; the rest loads after first paint
+    for editor in ["pro2", "segment"]:
+        yield f"startup/import_{editor}", lambda: None, lambda _, editor=editor: subprocess.run(
+            [sys.executable, "-c", f"import {editor}"], cwd=HERE, check=True)
+    cache = DecodeCache(os.path.join(directory, "cache"))
+    first = once(lambda: cache.load(inputs[0][1]()))
+    for label, path in inputs:
+        source = once(lambda path=path: cache.load(path()))
+        with_other = once(lambda source=source: (source(), first()))
+        yield f"{label}/decode", path, lambda path: Source.from_segment(AudioSegment.from_file(path))
+        yield f"{label}/load_cached", source, lambda _, path=path: cache.load(path())
+        yield f"{label}/waveform", source, draw
+        yield f"{label}/cut", source, lambda source: drain(source[len(source) // 4:len(source) * 3 // 4])
+        yield f"{label}/merge", with_other, lambda sources: drain(sources[0] + sources[1])
+        yield f"{label}/speed", source, lambda source: drain(source.speedup(playback_speed=1.5))
+        yield f"{label}/frequency", source, lambda source: drain(source.set_frame_rate(22050))
+        yield f"{label}/volume", source, lambda source: drain(source + 6)
+        yield f"{label}/loudness", source, lambda source: measure_loudness(source[len(source) // 4:len(source) * 3 // 4] + 6)
+        if is_mp3(label):
+            index = once(lambda path=path: SeekIndex.build(path()))
+            yield f"{label}/seek_index", path, SeekIndex.build
+            yield f"{label}/range_decode", once(lambda source=source, index=index: (source(), index())), \
+                lambda pair: pair[1].source(len(pair[0]) // 2, len(pair[0]) // 2 + 5000)
+        out = os.path.join(directory, "export.mp3")
+        yield f"{label}/export", source, lambda source, out=out: ExportJob(source, [(out, "mp3", None)]).run()
+
+
+def run(repeat, synthetic_seconds, only=None):
+    directory = tempfile.mkdtemp(prefix="audio_bench_")
+    try:
+        # Each input's path comes from a function, so a synthetic file is only written
+        # when a case that reads it runs
+        inputs = [(name, lambda path=os.path.join(HERE, name): path)
+                  for name in SAMPLES if os.path.exists(os.path.join(HERE, name))]
+        for seconds in synthetic_seconds:
+            path = os.path.join(directory, f"synthetic_{seconds}s.wav")
+            inputs.append((f"synthetic_{seconds}s", once(lambda path=path, seconds=seconds: synthetic_file(path, seconds))))
+        results = {}
+        for name, setup, function in cases(inputs, directory):
+            if only and only not in name:
+                continue
+            prepared = setup()
+            result = results[name] = isolated(lambda: function(prepared), repeat)
+            if "error" in result:
+                print(f"{name:40s} failed: {result['error']}")
+                continue
+            print(f"{name:40s} {result['median'] * 1000:10.1f} ms  "
+                  f"({result['peak_rss_mb']:.0f} MB peak RSS, +{result['rss_growth_mb']:.0f} MB)")
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def compare(results, baseline, threshold, floor_ms=5.0):
+    # A case regresses when its fastest run is slower than the baseline's by more than
+    # `threshold` and by more than `floor_ms`; the fastest run is the one least disturbed
+    # by the rest of the machine, and the floor keeps sub-millisecond cases from failing
+    # on timer noise
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or "min" not in old or "min" not in result:
+            continue
+        change = result["min"] / old["min"] - 1 if old["min"] else 0
+        regressed = change > threshold and (result["min"] - old["min"]) * 1000 > floor_ms
+        marker = "REGRESSION" if regressed else ""
+        print(f"{name:40s} {old['min'] * 1000:10.1f} -> {result['min'] * 1000:10.1f} ms  {change:+7.1%} {marker}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the editor's hot paths on the bundled and synthetic audio.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--synthetic", type=int, nargs="*", default=[600], help="lengths of synthetic inputs in seconds")
+    parser.add_argument("--only", help="run cases whose name contains this text")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the results (not tracked by git)")
+    parser.add_argument("--baseline", help="results file to compare against, such as bench_baseline.json, the "
+                                           "committed results of a reference run (see its machine fields)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--floor", type=float, default=5.0, help="slowdowns smaller than this many ms never fail")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.synthetic, args.only)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.floor)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%} "
+                  f"and {args.floor:g} ms")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from dsp import SAMPLE_TYPES
+from edits import Source
+from loudness import BlockStats
+from seekindex import SeekIndex
+from tracing import span, traced
+from waveform import PeakPyramid
+
+CACHE_DIR = os.environ.get("AUDIO_EDITOR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "audio_editor"))
+CACHE_LIMIT = int(os.environ.get("AUDIO_EDITOR_CACHE_LIMIT", 2 * 1024 ** 3))
+STALE_SECONDS = 3600  # A temporary file not written to for this long was left by a decode that died
+
+
+class DecodeCache:
+    # Decoded PCM is stored once per file content as a raw sample file that later
+    # opens map straight into memory; the least recently used entries are evicted
+    # once the directory grows past max_bytes.
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_LIMIT):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "paths.json")
+        self.lock = threading.Lock()  # Files may be loaded from several threads at once
+        self.evict()
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def known_key(self, path):
+        # The key of a file hashed before and unchanged since, without reading it; else None
+        stat = os.stat(path)
+        with self.lock:
+            known = self.read_index().get(os.path.realpath(path))
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        return None
+
+    @traced("cache.key")
+    def key(self, path):
+        # The content hash is remembered per (path, size, mtime) so unchanged files are not re-read
+        known = self.known_key(path)
+        if known:
+            return known
+        stat = os.stat(path)
+        real = os.path.realpath(path)
+        digest = hashlib.sha1()
+        with open(path, "rb") as f, span("cache.hash") as hashing:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+                hashing.add_bytes(len(chunk))
+        key = f"{digest.hexdigest()}-{stat.st_mtime_ns}"
+        with self.lock:
+            index = self.read_index()
+            index[real] = [stat.st_size, stat.st_mtime_ns, key]
+            self.write_json(self.index_path, index)
+        return key
+
+    def read_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_json(self, path, data):
+        # Write to a temporary file first so readers never see a partial file
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(temp, path)
+
+    @traced("cache.load")
+    def load(self, path):
+        key = self.key(path)
+        meta = self.lookup(key)
+        if meta is None:
+            with span("decode", path=path) as decoding:
+                segment = AudioSegment.from_file(path)
+                decoding.add_bytes(len(segment.raw_data))
+            self.store(key, segment)
+            meta = self.lookup(key)
+        return self.open(key, meta)
+
+    def lookup(self, key):
+        try:
+            with open(self.path(key, ".json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.path(key, ".pcm")):
+            return None
+        os.utime(self.path(key, ".pcm"))  # Mark as recently used
+        return meta
+
+    def open(self, key, meta):
+        shape = (meta["frames"], meta["channels"])
+        if meta["frames"]:
+            samples = np.memmap(self.path(key, ".pcm"), dtype=SAMPLE_TYPES[meta["sample_width"]], mode="r", shape=shape)
+        else:
+            samples = np.zeros(shape, dtype=SAMPLE_TYPES[meta["sample_width"]])
+        try:
+            pyramid = PeakPyramid.load(self.path(key, ".peaks.npz"), samples, meta["frame_rate"])
+        except (OSError, ValueError, KeyError):
+            pyramid = PeakPyramid(samples, meta["frame_rate"])
+            pyramid.save(self.path(key, ".peaks.npz"))
+        source = Source(samples, meta["frame_rate"], meta["sample_width"], pyramid=pyramid)
+        try:
+            source.stats = BlockStats.load(self.path(key, ".stats.npz"), meta["frame_rate"], source.render)
+        except (OSError, ValueError, KeyError):
+            source.stats = BlockStats.build(source)
+            source.stats.save(self.path(key, ".stats.npz"))
+        return source
+
+    @traced("cache.seek_index")
+    def seek_index(self, path, key=None):
+        # MP3 frame offsets, built once per file content and kept with its decoded samples
+        index_path = self.path(key or self.key(path), ".seek.npz")
+        try:
+            return SeekIndex.load(index_path, path)
+        except (OSError, ValueError, KeyError):
+            index = SeekIndex.build(path)
+            index.save(index_path)
+            return index
+
+    @traced("cache.store")
+    def store(self, key, segment):
+        if segment.sample_width not in SAMPLE_TYPES:
+            segment = segment.set_sample_width(4)
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(segment.raw_data)
+        self.commit(key, temp, segment.frame_rate, segment.channels, segment.sample_width, int(segment.frame_count()))
+
+    def commit(self, key, pcm_path, frame_rate, channels, sample_width, frames, pyramid=None, stats=None):
+        # Adopt a finished raw sample file written inside the cache directory (or already moved into place)
+        if pcm_path != self.path(key, ".pcm"):
+            os.replace(pcm_path, self.path(key, ".pcm"))
+        if pyramid is not None:
+            pyramid.save(self.path(key, ".peaks.npz"))
+        if stats is not None:
+            stats.save(self.path(key, ".stats.npz"))
+        self.write_json(self.path(key, ".json"), {
+            "frame_rate": frame_rate,
+            "channels": channels,
+            "sample_width": sample_width,
+            "frames": frames,
+        })
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        # Temporary files count against the limit while a decode is writing them; ones
+        # left by a decode that was interrupted are removed
+        entries = {}
+        pending = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name == "paths.json":
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+                if name.endswith(".tmp"):
+                    if now - stat.st_mtime > STALE_SECONDS:
+                        os.remove(os.path.join(self.directory, name))
+                    else:
+                        pending += stat.st_size
+                    continue
+            except OSError:
+                continue  # Committed or removed meanwhile
+            key = name.split(".", 1)[0]
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        total = pending + sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for suffix in (".pcm", ".json", ".peaks.npz", ".stats.npz", ".seek.npz"):
+                try:
+                    os.remove(self.path(key, suffix))
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,58 @@
+from fractions import Fraction
+
+import numpy as np
+from scipy.signal import resample_poly
+
+SAMPLE_TYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def to_float(samples, sample_width, out=None):
+    # Integer PCM to float32 in [-1, 1) in a single pass
+    return np.multiply(samples, np.float32(1.0 / 2 ** (8 * sample_width - 1)), out=out, dtype=np.float32)
+
+
+def to_pcm(samples, sample_width=2):
+    # Float samples to clipped interleaved integer PCM bytes; `samples` is scaled in place
+    scale = np.float32(2 ** (8 * sample_width - 1))
+    samples *= scale
+    np.clip(samples, -scale, np.nextafter(scale, np.float32(0)), out=samples)
+    return samples.astype(SAMPLE_TYPES[sample_width]).tobytes()
+
+
+def db_to_factor(db):
+    return np.float32(10 ** (db / 20))
+
+
+def apply_gain(samples, db, out=None):
+    out = np.multiply(samples, db_to_factor(db), out=out)
+    return np.clip(out, -1, 1, out=out)
+
+
+def rational(from_rate, to_rate, limit=1000):
+    # Output frames per input frame as up / down with a bounded polyphase filter bank
+    ratio = Fraction(to_rate, from_rate).limit_denominator(limit)
+    return ratio.numerator, ratio.denominator
+
+
+def resample(samples, from_rate, to_rate):
+    up, down = rational(from_rate, to_rate)
+    return resample_poly(samples, up, down, axis=0)[:len(samples) * up // down]
+
+
+def resample_window(up, down, start, end):
+    # Input frames needed to produce output frames [start, end) exactly as a whole-buffer
+    # resample would: the window starts on a multiple of `down` so the polyphase
+    # filter lands on the same phases, and is padded by the filter half length.
+    pad = 10 * max(up, down) // up + 1
+    in_start = ((start * down) // up - pad) // down * down
+    in_end = -(-end * down // up) + pad
+    return in_start, in_end, start - in_start * up // down
+
+
+def resample_range(render, up, down, start, end, channels):
+    # Resample output frames [start, end) pulling input through render(in_start, in_end)
+    in_start, in_end, skip = resample_window(up, down, start, end)
+    samples = render(max(0, in_start), in_end)
+    if in_start < 0:
+        samples = np.concatenate([np.zeros((-in_start, channels), dtype=np.float32), samples])
+    return resample_poly(samples, up, down, axis=0)[skip:skip + end - start]
@@ -0,0 +1,425 @@
+import bisect
+
+import numpy as np
+from pydub import AudioSegment
+
+import dsp
+from stretch import TimeStretcher, time_stretch
+from waveform import PeakPyramid, segment_samples
+
+
+def fit(samples, count, channels):
+    # Pad or trim rendered samples to exactly `count` frames
+    out = np.zeros((count, channels), dtype=np.float32)
+    if len(samples):
+        out[:min(count, len(samples))] = samples[:count]
+    return out
+
+
+class Node:
+    # Edits build a graph of lightweight nodes over the decoded sources; samples are
+    # only produced for the frames a caller asks for. The methods mirror AudioSegment.
+    frame_rate = 44100
+    channels = 1
+    sample_width = 2
+    frame_count = 0
+    growing = False  # True while a source underneath is still being decoded
+
+    def __len__(self):
+        return round(self.frame_count * 1000 / self.frame_rate)
+
+    def ms_to_frame(self, ms):
+        return max(0, min(self.frame_count, int(ms * self.frame_rate / 1000)))
+
+    def __getitem__(self, millisecond):
+        if not isinstance(millisecond, slice):
+            millisecond = slice(millisecond, millisecond + 1)
+        start = 0 if millisecond.start is None else millisecond.start
+        end = len(self) if millisecond.stop is None else millisecond.stop
+        if start < 0:
+            start += len(self)
+        if end < 0:
+            end += len(self)
+        if self.growing:
+            # Not clamped to the length decoded so far; the slice fills in as the rest arrives
+            end = None if millisecond.stop is None else max(0, int(end * self.frame_rate / 1000))
+            return Slice(self, max(0, int(start * self.frame_rate / 1000)), end)
+        return Slice(self, self.ms_to_frame(start), self.ms_to_frame(end))
+
+    def __add__(self, other):
+        if isinstance(other, Node):
+            return Concat.join(self, other)
+        return self.apply_gain(other)
+
+    def apply_gain(self, volume_change):
+        if volume_change == 0:
+            return self
+        return Gain(self, volume_change)
+
+    def set_frame_rate(self, frame_rate):
+        if frame_rate == self.frame_rate:
+            return self
+        return Resample(self, frame_rate)
+
+    def set_channels(self, channels):
+        if channels == self.channels:
+            return self
+        return Remix(self, channels)
+
+    def speedup(self, playback_speed=1.5):
+        if playback_speed == 1:
+            return self
+        return Speed(self, playback_speed)
+
+    def render(self, start, end):
+        raise NotImplementedError
+
+    def stream(self, start, frames, stopped=None):
+        # Consecutive blocks from frame `start` to the end; nodes that carry state from
+        # one block to the next override this so playback stays continuous. `stopped`,
+        # when given, is polled by sources that wait for frames still being decoded.
+        for position in range(max(0, start), self.frame_count, frames):
+            yield self.render(position, min(position + frames, self.frame_count))
+
+    def peaks(self, start, end, bins):
+        samples = self.render(start, end)
+        edges = np.unique(np.linspace(0, len(samples), max(1, int(bins)), endpoint=False).astype(np.int64))
+        if len(samples) == 0:
+            return edges[:0], samples, samples
+        return start + edges, np.minimum.reduceat(samples, edges), np.maximum.reduceat(samples, edges)
+
+    def to_segment(self, start=0, end=None, sample_width=None):
+        end = self.frame_count if end is None else end
+        sample_width = sample_width or self.sample_width
+        return AudioSegment(data=dsp.to_pcm(self.render(start, end), sample_width),
+                            sample_width=sample_width, frame_rate=self.frame_rate, channels=self.channels)
+
+    def export(self, out_f, format="mp3", **kwargs):
+        return self.to_segment().export(out_f, format=format, **kwargs)
+
+
+class Source(Node):
+    def __init__(self, samples, frame_rate, sample_width, pyramid=None, stats=None):
+        self.samples = samples  # (frames, channels) integer samples, never modified
+        self.frame_rate = frame_rate
+        self.channels = samples.shape[1]
+        self.sample_width = sample_width
+        self.frame_count = len(samples)
+        self.scale = 1.0 / 2 ** (8 * sample_width - 1)  # For the integer peak pyramid
+        self.pyramid = pyramid or PeakPyramid(samples, frame_rate)
+        self.stats = stats  # loudness.BlockStats, built on first use when not given
+
+    @classmethod
+    def from_segment(cls, segment):
+        return cls(segment_samples(segment), segment.frame_rate, segment.sample_width)
+
+    def render(self, start, end):
+        return dsp.to_float(self.samples[max(0, start):max(0, end)], self.sample_width)
+
+    def peaks(self, start, end, bins):
+        positions, mins, maxs = self.pyramid.peaks(start, end, bins)
+        return positions, mins * self.scale, maxs * self.scale
+
+
+class Slice(Node):
+    # Frames [start, end) of the child; end=None runs to the child's end. The length is
+    # read from the child each time, so a slice of a source that is still being decoded
+    # follows it up to `end`.
+    def __init__(self, child, start, end):
+        if isinstance(child, Slice):
+            end = None if end is None else child.start + end
+            if child.end is not None:
+                end = child.end if end is None else min(end, child.end)
+            start, child = child.start + start, child.child
+        self.child = child
+        self.start = start
+        self.end = end
+        self.frame_rate = child.frame_rate
+        self.channels = child.channels
+        self.sample_width = child.sample_width
+
+    @property
+    def frame_count(self):
+        end = self.child.frame_count if self.end is None else min(self.end, self.child.frame_count)
+        return max(0, end - self.start)
+
+    @property
+    def growing(self):
+        return self.child.growing and (self.end is None or self.child.frame_count < self.end)
+
+    def clamp(self, start, end):
+        frame_count = self.frame_count
+        return self.start + max(0, min(start, frame_count)), self.start + max(0, min(end, frame_count))
+
+    def render(self, start, end):
+        return self.child.render(*self.clamp(start, end))
+
+    def stream(self, start, frames, stopped=None):
+        position = self.start + max(0, start)
+        for block in self.child.stream(position, frames, stopped):
+            if self.end is not None:
+                block = block[:self.end - position]
+            if len(block) == 0:
+                break
+            yield block
+            position += len(block)
+
+    def peaks(self, start, end, bins):
+        positions, mins, maxs = self.child.peaks(*self.clamp(start, end), bins)
+        return positions - self.start, mins, maxs
+
+
+class Concat(Node):
+    def __init__(self, children):
+        self.children = children
+        self.frame_rate = children[0].frame_rate
+        self.channels = children[0].channels
+        self.sample_width = max(child.sample_width for child in children)
+        self.fixed = None  # Offsets, once no child can grow any more
+
+    @property
+    def offsets(self):
+        # Where each child starts, plus the end; worked out afresh while a child is still
+        # being decoded so the children after it move along as it grows
+        if self.fixed is not None:
+            return self.fixed
+        growing = self.growing  # Checked first: once it is False the lengths are final
+        offsets = [0]
+        for child in self.children:
+            offsets.append(offsets[-1] + child.frame_count)
+        if not growing:
+            self.fixed = offsets
+        return offsets
+
+    @property
+    def frame_count(self):
+        return self.offsets[-1]
+
+    @property
+    def growing(self):
+        return self.fixed is None and any(child.growing for child in self.children)
+
+    @classmethod
+    def join(cls, first, second):
+        # Like AudioSegment addition, both sides are brought to the higher rate and channel count
+        frame_rate = max(first.frame_rate, second.frame_rate)
+        channels = max(first.channels, second.channels)
+        children = []
+        for node in (first, second):
+            node = node.set_frame_rate(frame_rate).set_channels(channels)
+            children.extend(node.children if isinstance(node, Concat) else [node])
+        return cls(children)
+
+    def overlapping(self, start, end):
+        offsets = self.offsets
+        index = max(0, bisect.bisect_right(offsets, start) - 1)
+        while index < len(self.children) and offsets[index] < end:
+            offset = offsets[index]
+            yield offset, self.children[index], max(start - offset, 0), min(end, offsets[index + 1]) - offset
+            index += 1
+
+    def render(self, start, end):
+        start, end = max(0, start), min(end, self.frame_count)
+        out = np.zeros((max(0, end - start), self.channels), dtype=np.float32)
+        for offset, child, child_start, child_end in self.overlapping(start, end):
+            out[offset + child_start - start:offset + child_end - start] = child.render(child_start, child_end)
+        return out
+
+    def stream(self, start, frames, stopped=None):
+        # Each child's length is read when it is reached, after the ones before it have
+        # been streamed to their end, so a child still being decoded is played out in full
+        start, offset = max(0, start), 0
+        for child in self.children:
+            if start < offset + child.frame_count or child.growing:
+                yield from child.stream(max(0, start - offset), frames, stopped)
+            offset += child.frame_count
+
+    def peaks(self, start, end, bins):
+        start, end = max(0, start), min(end, self.frame_count)
+        parts = []
+        for offset, child, child_start, child_end in self.overlapping(start, end):
+            share = max(1, round(bins * (child_end - child_start) / max(1, end - start)))
+            positions, mins, maxs = child.peaks(child_start, child_end, share)
+            parts.append((positions + offset, mins, maxs))
+        if not parts:
+            return Node.peaks(self, start, start, bins)
+        return tuple(np.concatenate(part) for part in zip(*parts))
+
+
+class Gain(Node):
+    def __init__(self, child, volume_change):
+        if isinstance(child, Gain):
+            volume_change, child = child.volume_change + volume_change, child.child
+        self.child = child
+        self.volume_change = volume_change
+        self.factor = dsp.db_to_factor(volume_change)
+        self.frame_rate = child.frame_rate
+        self.channels = child.channels
+        self.sample_width = child.sample_width
+
+    @property
+    def frame_count(self):
+        return self.child.frame_count  # Follows a source that is still being decoded
+
+    @property
+    def growing(self):
+        return self.child.growing
+
+    def render(self, start, end):
+        samples = self.child.render(start, end)
+        return dsp.apply_gain(samples, self.volume_change, out=samples)
+
+    def stream(self, start, frames, stopped=None):
+        for block in self.child.stream(start, frames, stopped):
+            yield dsp.apply_gain(block, self.volume_change, out=block)
+
+    def peaks(self, start, end, bins):
+        positions, mins, maxs = self.child.peaks(start, end, bins)
+        return positions, np.clip(mins * self.factor, -1, 1), np.clip(maxs * self.factor, -1, 1)
+
+
+class Remix(Node):
+    def __init__(self, child, channels):
+        self.child = child
+        self.frame_rate = child.frame_rate
+        self.channels = channels
+        self.sample_width = child.sample_width
+
+    @property
+    def frame_count(self):
+        return self.child.frame_count
+
+    @property
+    def growing(self):
+        return self.child.growing
+
+    def remix(self, samples):
+        if self.channels == 1:
+            return samples.mean(axis=1, keepdims=True)
+        return np.repeat(samples.mean(axis=1, keepdims=True), self.channels, axis=1)
+
+    def render(self, start, end):
+        return self.remix(self.child.render(start, end))
+
+    def stream(self, start, frames, stopped=None):
+        for block in self.child.stream(start, frames, stopped):
+            yield self.remix(block)
+
+    def peaks(self, start, end, bins):
+        positions, mins, maxs = self.child.peaks(start, end, bins)
+        return positions, self.remix(mins), self.remix(maxs)
+
+
+class Resample(Node):
+    def __init__(self, child, frame_rate):
+        if isinstance(child, Resample):
+            child = child.child  # Resample from the original rate rather than twice
+        self.child = child
+        self.frame_rate = frame_rate
+        self.up, self.down = dsp.rational(child.frame_rate, frame_rate)
+        self.ratio = self.down / self.up  # Input frames per output frame
+        self.channels = child.channels
+        self.sample_width = child.sample_width
+
+    @property
+    def frame_count(self):
+        return self.child.frame_count * self.up // self.down
+
+    @property
+    def growing(self):
+        return self.child.growing
+
+    def render(self, start, end):
+        start, end = max(0, start), min(end, self.frame_count)
+        if end <= start:
+            return fit([], 0, self.channels)
+        samples = dsp.resample_range(self.child.render, self.up, self.down, start, end, self.channels)
+        return fit(samples, end - start, self.channels)
+
+    def stream(self, start, frames, stopped=None):
+        # Keep a sliding window of the child's stream so its state is never restarted.
+        # Input is pulled until it covers the next block, so a child that is still being
+        # decoded is waited for rather than taken to end where it has got to.
+        start = max(0, start)
+        offset = max(0, dsp.resample_window(self.up, self.down, start, start)[0])
+        blocks = self.child.stream(offset, max(1, frames * self.down // self.up), stopped)
+        buffer = fit([], 0, self.channels)
+        position, exhausted = start, False
+        while True:
+            in_end = dsp.resample_window(self.up, self.down, position, position + frames)[1]
+            while not exhausted and offset + len(buffer) < in_end:
+                block = next(blocks, None)
+                if block is None:
+                    exhausted = True
+                    break
+                buffer = np.concatenate([buffer, block])
+            end = min(position + frames, self.frame_count)
+            if end <= position:
+                return
+            in_start = dsp.resample_window(self.up, self.down, position, end)[0]
+            drop = max(0, min(in_start - offset, len(buffer)))
+            buffer, offset = buffer[drop:], offset + drop
+            window = buffer  # Bound for the lambda below; `buffer` is rebound on the next pass
+            samples = dsp.resample_range(lambda a, b: window[a - offset:b - offset],
+                                         self.up, self.down, position, end, self.channels)
+            yield fit(samples, end - position, self.channels)
+            position = end
+
+    def peaks(self, start, end, bins):
+        positions, mins, maxs = self.child.peaks(int(start * self.ratio), int(end * self.ratio), bins)
+        return (positions / self.ratio).astype(np.int64), mins, maxs
+
+
+class Speed(Node):
+    def __init__(self, child, playback_speed):
+        if isinstance(child, Speed):
+            playback_speed, child = child.playback_speed * playback_speed, child.child
+        self.child = child
+        self.playback_speed = playback_speed
+        self.frame_rate = child.frame_rate
+        self.channels = child.channels
+        self.sample_width = child.sample_width
+
+    @property
+    def frame_count(self):
+        return int(self.child.frame_count / self.playback_speed)
+
+    @property
+    def growing(self):
+        return self.child.growing
+
+    def render(self, start, end):
+        start, end = max(0, start), min(end, self.frame_count)
+        if end <= start:
+            return fit([], 0, self.channels)
+        # Stretch some context on both sides so the analysis frames at the edges are complete
+        speed = self.playback_speed
+        margin = 2 * TimeStretcher(speed, self.frame_rate, self.channels).size
+        in_start = max(0, int(start * speed) - margin)
+        samples = time_stretch(self.child.render(in_start, int(end * speed) + margin), speed, self.frame_rate)
+        skip = round(start - in_start / speed)
+        return fit(samples[skip:], end - start, self.channels)
+
+    def stream(self, start, frames, stopped=None):
+        # The output is only cut to length once the child has stopped growing
+        position = max(0, start)
+        speed = self.playback_speed
+        stretcher = TimeStretcher(speed, self.frame_rate, self.channels)
+        for block in self.child.stream(int(position * speed), max(1, int(frames * speed)), stopped):
+            out = stretcher.process(block)
+            if not self.growing:
+                out = out[:max(0, self.frame_count - position)]
+            if len(out):
+                yield out
+                position += len(out)
+            if position >= self.frame_count and not self.growing:
+                return
+        out = stretcher.flush()[:max(0, self.frame_count - position)]
+        if len(out):
+            yield out
+
+    def peaks(self, start, end, bins):
+        speed = self.playback_speed
+        positions, mins, maxs = self.child.peaks(int(start * speed), int(end * speed), bins)
+        return (positions / speed).astype(np.int64), mins, maxs
+
@@ -0,0 +1,134 @@
+import threading
+
+import numpy as np
+
+import dsp
+from stretch import TimeStretcher
+
+
+class StreamResampler:
+    # Resample a stream block by block with the same polyphase filter as dsp.resample.
+    # Input is held back by the filter half length so block edges join seamlessly.
+    def __init__(self, from_rate, to_rate, channels):
+        self.up, self.down = dsp.rational(from_rate, to_rate)
+        self.channels = channels
+        self.pad = 10 * max(self.up, self.down) // self.up + 1
+        self.buffer = np.zeros((0, channels), dtype=np.float32)
+        self.offset = 0  # Input frame index of buffer[0]
+        self.produced = 0
+
+    def window(self, start, end):
+        return self.buffer[start - self.offset:end - self.offset]
+
+    def process(self, samples, final=False):
+        self.buffer = np.concatenate([self.buffer, samples])
+        received = self.offset + len(self.buffer)
+        end = received * self.up // self.down if final else max(0, received - self.pad) * self.up // self.down
+        if end <= self.produced:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        out = dsp.resample_range(self.window, self.up, self.down, self.produced, end, self.channels)
+        self.produced = end
+        keep = max(self.offset, dsp.resample_window(self.up, self.down, end, end)[0])
+        self.buffer = self.buffer[keep - self.offset:]
+        self.offset = keep
+        return out
+
+
+class Engine:
+    # Player reader that pulls fixed-size blocks from a node and applies speed,
+    # frequency and volume on the way out. The settings can be changed while it plays
+    # and take effect on the next block; nothing is re-rendered or restarted.
+    #  - speed: a phase vocoder whose analysis hop follows the current speed
+    #  - frequency: resampled to that rate and back, as set_frame_rate sounds when played
+    #  - volume: gain in dB, ramped across a block so changes do not click
+    def __init__(self, node, start_ms=0, speed=1.0, frequency=None, volume=0.0, block_ms=20):
+        self.frame_rate = node.frame_rate
+        self.channels = node.channels
+        self.block_frames = max(1, self.frame_rate * block_ms // 1000)
+        self.speed = speed
+        self.frequency = frequency
+        self.volume = volume
+        self.factor = dsp.db_to_factor(volume)
+        self.stretcher = None
+        self.resamplers = None
+        self.applied_frequency = None
+        self.position = 0
+        self.pending = None
+        self.stopped = threading.Event()
+        self.start(node, start_ms)
+
+    def start(self, node, start_ms):
+        # Source positions are tracked in frames of the unprocessed node
+        node = node.set_frame_rate(self.frame_rate).set_channels(self.channels)
+        self.node = node
+        self.source_position = node.ms_to_frame(start_ms)
+        self.position = round(self.source_position / self.speed)
+        self.blocks = node.stream(self.source_position, self.block_frames, self.stopped.is_set)
+        self.buffer = np.zeros((0, self.channels), dtype=np.float32)
+        self.stretcher = None
+        self.resamplers = None
+        self.applied_frequency = None
+        self.finished = False
+
+    def set_speed(self, speed):
+        self.speed = speed
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def stop(self):
+        # Release a read that is waiting for frames still being decoded
+        self.stopped.set()
+
+    def switch(self, node, start_ms):
+        # Continue from `start_ms` of a different node on the next block
+        self.pending = (node, start_ms)
+
+    def filter(self, samples, final=False):
+        if self.speed != 1 and self.stretcher is None:
+            self.stretcher = TimeStretcher(self.speed, self.frame_rate, self.channels)
+        if self.stretcher is not None:
+            self.stretcher.speed = self.speed
+            samples = self.stretcher.process(samples)
+            if final:
+                samples = np.concatenate([samples, self.stretcher.flush()])
+        if self.frequency != self.applied_frequency:
+            self.applied_frequency = self.frequency
+            self.resamplers = None
+            if self.frequency and self.frequency != self.frame_rate:
+                self.resamplers = (StreamResampler(self.frame_rate, self.frequency, self.channels),
+                                   StreamResampler(self.frequency, self.frame_rate, self.channels))
+        if self.resamplers is not None:
+            down, up = self.resamplers
+            samples = up.process(down.process(samples, final), final)
+        return samples
+
+    def read(self, frames):
+        if self.pending is not None:
+            node, start_ms = self.pending
+            self.pending = None
+            self.start(node, start_ms)
+        while len(self.buffer) < frames and not self.finished:
+            block = next(self.blocks, None)
+            if block is None:
+                self.finished = True
+                out = self.filter(np.zeros((0, self.channels), dtype=np.float32), final=True)
+            else:
+                self.source_position += len(block)
+                out = self.filter(block)
+            self.buffer = np.concatenate([self.buffer, out])
+        block, self.buffer = self.buffer[:frames], self.buffer[frames:]
+        if len(block) == 0:
+            return b""
+        factor = dsp.db_to_factor(self.volume)
+        if factor == self.factor:
+            block = dsp.apply_gain(block, self.volume, out=block.copy())
+        else:
+            ramp = np.linspace(self.factor, factor, len(block), dtype=np.float32)[:, None]
+            block = np.clip(block * ramp, -1, 1)
+            self.factor = factor
+        self.position += len(block)
+        return dsp.to_pcm(block)
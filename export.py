@@ -0,0 +1,134 @@
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pydub import AudioSegment
+
+import dsp
+from tracing import span
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportJob:
+    # Stream a node's samples block by block into one ffmpeg encoder per target. The
+    # graph is rendered once whatever the number of targets and never as a whole, so
+    # memory use does not depend on the length of the edit; the encoders run as
+    # separate processes and so use the other cores. A node over a file that is
+    # still being decoded is followed to its end, however long that turns out to be.
+    def __init__(self, node, targets, block_frames=65536):
+        self.node = node
+        self.targets = targets  # (path, format, bitrate) tuples
+        self.block_frames = block_frames
+        self.written = 0
+        self.error = None
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+
+    def command(self, path, format, bitrate):
+        node = self.node
+        command = [AudioSegment.converter, "-y", "-v", "error", "-f", "s16le", "-ar", str(node.frame_rate),
+                   "-ac", str(node.channels), "-i", "-"]
+        if format == "ogg":
+            command += ["-acodec", "libvorbis"]  # As pydub does; ffmpeg would pick flac in ogg
+        if bitrate:
+            command += ["-b:a", bitrate]
+        return command + ["-f", format, path]
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def frame_count(self):
+        return self.node.frame_count
+
+    def progress(self):
+        # Of the length known so far, which grows with a file still being decoded
+        if self.finished.is_set():
+            return 1.0
+        return min(0.99, self.written / self.frame_count) if self.frame_count else 0.0
+
+    def run(self):
+        with span("export", targets=[path for path, _, _ in self.targets]) as encoding:
+            self.encode(encoding)
+
+    def encode(self, encoding):
+        processes = []
+        try:
+            for target in self.targets:
+                processes.append(subprocess.Popen(self.command(*target), stdin=subprocess.PIPE,
+                                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE))
+            for block in self.node.stream(0, self.block_frames, self.cancelled.is_set):
+                if self.cancelled.is_set():
+                    raise ExportCancelled()
+                growing = self.node.growing  # Read before the length so a final length is final
+                if not growing:
+                    block = block[:max(0, self.frame_count - self.written)]
+                data = dsp.to_pcm(block)
+                for process in processes:
+                    process.stdin.write(data)
+                encoding.add_bytes(len(data) * len(processes))
+                self.written += len(data) // (2 * self.node.channels)
+                if not growing and self.written >= self.frame_count:
+                    break
+            for process, (path, _, _) in zip(processes, self.targets):
+                process.stdin.close()
+                if process.wait() != 0:
+                    raise RuntimeError(f"{path}: {process.stderr.read().decode(errors='replace').strip()}")
+        except BaseException as e:
+            for process in processes:
+                process.kill()
+                process.wait()
+            for path, _, _ in self.targets:
+                if os.path.exists(path):
+                    os.remove(path)  # Never leave truncated files behind
+            if not isinstance(e, ExportCancelled):
+                self.error = e
+                print(f"Error exporting: {e}")
+        finally:
+            for process in processes:
+                process.stderr.close()
+            self.finished.set()
+
+
+class Exporter:
+    # Jobs run on a thread pool so several edits can be saved at once without blocking the UI
+    def __init__(self, workers=None):
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.jobs = []
+
+    def export(self, node, targets):
+        job = ExportJob(node, targets)
+        self.pool.submit(job.run)
+        self.jobs = [job for job in self.jobs if not job.finished.is_set()] + [job]
+        return job
+
+    def cancel(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def busy(self):
+        return any(not job.finished.is_set() for job in self.jobs)
+
+    def progress(self):
+        if not self.jobs:
+            return 1.0
+        return sum(job.progress() for job in self.jobs) / len(self.jobs)
+
+
+def format_of(path, default="mp3"):
+    return os.path.splitext(path)[1][1:].lower() or default
+
+
+def parse_targets(path, spec):
+    # "mp3:192k, ogg, wav" -> one target per format, named after `path`
+    base = os.path.splitext(path)[0]
+    targets = []
+    for item in spec.split(","):
+        format, _, bitrate = item.strip().partition(":")
+        if format:
+            targets.append((f"{base}.{format}", format, bitrate or None))
+    return targets
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+
+from edits import Node, Source
+
+HISTORY_LIMIT = int(os.environ.get("AUDIO_EDITOR_HISTORY_LIMIT", 512 * 1024 ** 2))
+
+
+def walk(node, seen=None):
+    # Every node reachable from `node`, each once
+    seen = {} if seen is None else seen
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen[id(node)] = node
+        stack.extend(getattr(node, "children", ()))
+        if getattr(node, "child", None) is not None:
+            stack.append(node.child)
+    return seen
+
+
+def state_nodes(state):
+    seen = {}
+    for value in state.values():
+        if isinstance(value, Node):
+            walk(value, seen)
+    return seen
+
+
+def resident_bytes(node):
+    # Samples a source holds in memory; memory-mapped and file-backed sources cost nothing here
+    if isinstance(node, Source) and isinstance(node.samples, np.ndarray) and not isinstance(node.samples, np.memmap):
+        return node.samples.nbytes
+    return 0
+
+
+class History:
+    # Undo/redo over editor states (dicts of attributes). Edits are lazy graphs over
+    # shared sources, so a state is a few small nodes and versions share every sample
+    # they have in common. Only sources that the current state no longer uses cost
+    # memory; the oldest states are dropped once those exceed max_bytes.
+    def __init__(self, max_bytes=HISTORY_LIMIT, max_states=200):
+        self.max_bytes = max_bytes
+        self.max_states = max_states
+        self.undo_stack = []
+        self.redo_stack = []
+        self.group = None
+
+    def record(self, before, after, group=None):
+        # Call once an edit is made, with the states before and after it; the history is
+        # trimmed against `after`, which no longer uses what the edit replaced.
+        # Consecutive records in one group (a slider drag, say) collapse into a single
+        # undo step.
+        if group is not None and group == self.group:
+            return
+        self.group = group
+        self.undo_stack.append(before)
+        self.redo_stack.clear()
+        self.trim(after)
+
+    def end_group(self):
+        self.group = None
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.group = None
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self, current):
+        if not self.undo_stack:
+            return None
+        self.group = None
+        self.redo_stack.append(current)
+        state = self.undo_stack.pop()
+        self.trim(state)
+        return state
+
+    def redo(self, current):
+        if not self.redo_stack:
+            return None
+        self.group = None
+        self.undo_stack.append(current)
+        state = self.redo_stack.pop()
+        self.trim(state)
+        return state
+
+    def retained_bytes(self, current):
+        # Bytes kept alive only by history, not by `current`
+        live = state_nodes(current)
+        kept = {}
+        for state in self.undo_stack + self.redo_stack:
+            for key, node in state_nodes(state).items():
+                if key not in live:
+                    kept[key] = node
+        return sum(resident_bytes(node) for node in kept.values())
+
+    def trim(self, current):
+        while len(self.undo_stack) > self.max_states:
+            self.undo_stack.pop(0)
+        while self.undo_stack and self.retained_bytes(current) > self.max_bytes:
+            self.undo_stack.pop(0)
@@ -0,0 +1,266 @@
+import math
+import threading
+import weakref
+
+import numpy as np
+from scipy.signal import sosfilt
+
+from edits import Concat, Gain, Resample, Slice, Source, Speed
+from waveform import grow
+
+BUILD_FRAMES = 1 << 20  # Frames filtered at a time when building, to bound memory
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the level of the blocks above the absolute gate
+
+
+def k_weighting(frame_rate):
+    # The BS.1770 pre-filter (a high shelf) and RLB high-pass as second-order sections,
+    # derived for any rate from the analogue prototypes (as libebur128 does)
+    k = math.tan(math.pi * 1681.974450955533 / frame_rate)
+    q = 0.7071752369554196
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    k = math.tan(math.pi * 38.13547087602444 / frame_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    high_pass = [1, -2, 1, 1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+    return np.array([shelf, high_pass])
+
+
+class BlockStats:
+    # Peak, sum of squares and K-weighted sum of squares per channel for each block of
+    # `block_ms` of a node's samples. Filled in one vectorised pass per call to extend
+    # as frames are appended; the last block may be partial and is recomputed as more
+    # frames arrive. `render` reads the samples back for blocks cut by a range.
+    def __init__(self, frame_rate, channels, render, block_ms=100):
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.render = render
+        self.block = max(1, frame_rate * block_ms // 1000)
+        self.sos = k_weighting(frame_rate)
+        self.state = np.zeros((len(self.sos), 2, channels))  # Filter state after the last frame
+        self.tail = np.zeros((0, channels), dtype=np.float32)  # Frames after the last complete block
+        self.weighted_tail = np.zeros((0, channels))
+        self.peak = np.zeros((0, channels), dtype=np.float32)
+        self.squares = np.zeros((0, channels))
+        self.weighted = np.zeros((0, channels))
+        self.count = 0
+        self.complete = 0
+        self.frame_count = 0
+
+    @classmethod
+    def build(cls, node, block_ms=100, check=None):
+        stats = cls(node.frame_rate, node.channels, node.render, block_ms)
+        for samples in node.stream(0, BUILD_FRAMES):
+            if check is not None:
+                check()
+            stats.extend(np.clip(samples, -1, 1))  # As exported; a stretch can overshoot full scale
+        return stats
+
+    @classmethod
+    def load(cls, path, frame_rate, render):
+        with np.load(path) as data:
+            channels = data["peak"].shape[1]
+            stats = cls(frame_rate, channels, render)
+            stats.block = int(data["block"])
+            for name in ("state", "tail", "weighted_tail", "peak", "squares", "weighted"):
+                setattr(stats, name, data[name])
+            stats.complete = int(data["complete"])
+            stats.frame_count = int(data["frame_count"])
+        stats.count = len(stats.peak)
+        return stats
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, block=self.block, state=self.state, tail=self.tail,
+                     weighted_tail=self.weighted_tail, peak=self.peak[:self.count],
+                     squares=self.squares[:self.count], weighted=self.weighted[:self.count],
+                     complete=self.complete, frame_count=self.frame_count)
+
+    def extend(self, samples):
+        # `samples` are float frames following the last ones seen
+        if len(samples) == 0:
+            return
+        weighted, self.state = sosfilt(self.sos, samples, axis=0, zi=self.state)
+        tail = np.concatenate([self.tail, samples])
+        weighted = np.concatenate([self.weighted_tail, weighted])
+        edges = np.arange(0, len(tail), self.block)
+        first = self.complete
+        self.peak = grow(self.peak, first, np.maximum.reduceat(np.abs(tail), edges, axis=0))
+        self.squares = grow(self.squares, first, np.add.reduceat(np.square(tail, dtype=np.float64), edges, axis=0))
+        self.weighted = grow(self.weighted, first, np.add.reduceat(np.square(weighted), edges, axis=0))
+        complete = len(tail) // self.block
+        self.count, self.complete = first + len(edges), first + complete
+        self.tail = tail[complete * self.block:].copy()
+        self.weighted_tail = weighted[complete * self.block:].copy()
+        self.frame_count += len(samples)
+
+    def blocks(self, start, end, render=None):
+        # (peak, squares, weighted, frames) per block overlapping frames [start, end).
+        # Blocks cut by the range have their peak and squares recomputed from the
+        # samples (read through `render` if given) and their K-weighted energy taken
+        # pro rata.
+        start = max(0, min(start, self.frame_count))
+        end = max(start, min(end, self.frame_count))
+        first, last = start // self.block, -(-end // self.block)
+        peak = self.peak[first:last].copy()
+        squares = self.squares[first:last].copy()
+        weighted = self.weighted[first:last].copy()
+        starts = np.arange(first, last) * self.block
+        frames = (np.minimum(starts + self.block, self.frame_count) - starts).astype(np.float64)
+        for index in {first, last - 1} if last > first else ():
+            low, high = max(start, index * self.block), min(end, (index + 1) * self.block)
+            row = index - first
+            if high - low == frames[row]:
+                continue
+            samples = (render or self.render)(low, high)
+            peak[row] = np.abs(samples).max(axis=0)
+            squares[row] = np.square(samples, dtype=np.float64).sum(axis=0)
+            weighted[row] *= (high - low) / frames[row]
+            frames[row] = high - low
+        return peak, squares, weighted, frames
+
+
+lock = threading.Lock()
+derived = weakref.WeakKeyDictionary()  # Statistics of nodes that are not sums of their sources
+stretched = weakref.WeakKeyDictionary()  # Input of a speed change -> {speed: statistics of its output}
+
+
+def node_stats(node, check=None):
+    # Sources carry their statistics (built when they are loaded, or here on first use);
+    # anything else is rendered once and kept while the node is alive. A speed change
+    # is kept for as long as its input, since the editors make a new one for every
+    # edit on top of the same input. The cached statistics hold no reference to the
+    # node (collect passes its render), so they never keep it alive. Building happens
+    # outside the lock and can be cancelled through `check`; two threads asking for the
+    # same node at once may both build it.
+    with lock:
+        if isinstance(node, Source):
+            if node.stats is not None:
+                return node.stats
+        else:
+            if isinstance(node, Speed):
+                cache, key = stretched.setdefault(node.child, {}), node.playback_speed
+            else:
+                cache, key = derived.setdefault(node, {}), None
+            frames, stats = cache.get(key, (None, None))
+            if stats is not None and frames == node.frame_count:
+                return stats
+    frames = node.frame_count
+    stats = BlockStats.build(node, check=check)  # Waits for a source that is still being decoded
+    with lock:
+        if isinstance(node, Source):
+            if node.stats is None:
+                node.stats = stats
+            return node.stats
+        stats.render = None
+        cache[key] = (frames, stats)
+    return stats
+
+
+def collect(node, start, end, factor=1.0, scale=1.0, check=None):
+    # Block statistics of frames [start, end) of an edit graph, read from the statistics
+    # of the sources underneath: slices and joins select blocks, gains scale them, and
+    # rate changes map the range onto their input and rescale the frame counts (their
+    # loudness is taken to be that of the input). Costs O(blocks). A speed change does
+    # alter loudness, so its output is rendered once (see node_stats); the first
+    # measure of a new speed takes as long as stretching the audio. Peaks are not
+    # clipped here; each gain clips its own output (see unclipped).
+    start, end = max(0, start), min(end, node.frame_count)
+    if end <= start:
+        return
+    if isinstance(node, Slice):
+        yield from collect(node.child, node.start + start, node.start + end, factor, scale, check)
+    elif isinstance(node, Concat):
+        for _, child, child_start, child_end in node.overlapping(start, end):
+            yield from collect(child, child_start, child_end, factor, scale, check)
+    elif isinstance(node, Gain):
+        parts = collect(node.child, start, end, node.factor, check=check)
+        yield from scaled(unclipped(node, start, parts, check), factor, scale)
+    elif isinstance(node, Speed) and isinstance(node.child, Gain):
+        # Stretching is linear, so the gain is applied after it and the stretched
+        # statistics of the input are reused whatever the gain
+        gain = node.child
+        parts = collect(Speed(gain.child, node.playback_speed), start, end, gain.factor, check=check)
+        yield from scaled(unclipped(node, start, parts, check), factor, scale)
+    elif isinstance(node, Resample):
+        yield from collect(node.child, int(start * node.ratio), int(end * node.ratio), factor, scale / node.ratio, check)
+    else:
+        yield from scaled([node_stats(node, check).blocks(start, end, node.render)], factor, scale)
+
+
+def scaled(parts, factor, scale):
+    power = float(factor) ** 2 * scale
+    for peak, squares, weighted, frames in parts:
+        yield peak * factor, squares * power, weighted * power, frames * scale
+
+
+def unclipped(node, start, parts, check=None):
+    # A gain clips its output, so a part its gain takes over full scale is not its input
+    # scaled; those parts are read from the rendered node instead (see node_stats).
+    # `parts` are those of the node's own frames from `start`.
+    position = start
+    for part in parts:
+        length = round(part[3].sum())
+        if part[0].max(initial=0) > 1:
+            part = node_stats(node, check).blocks(position, position + length, node.render)
+        yield part
+        position += length
+
+
+def to_db(power):
+    return 10 * math.log10(power) if power > 0 else -math.inf
+
+
+def integrated(weighted, frames, blocks_per_window=4):
+    # Gated loudness per BS.1770: 400 ms windows overlapping by 75% (four 100 ms blocks,
+    # one block apart), an absolute gate, then a relative gate below the gated mean
+    energy = np.concatenate([[0.0], np.cumsum(weighted.sum(axis=1))])
+    duration = np.concatenate([[0.0], np.cumsum(frames)])
+    size = min(blocks_per_window, len(frames))
+    windows = (energy[size:] - energy[:-size]) / np.maximum(duration[size:] - duration[:-size], 1)
+    with np.errstate(divide="ignore"):
+        levels = -0.691 + 10 * np.log10(windows)
+    kept = windows[levels > ABSOLUTE_GATE]
+    if len(kept) == 0:
+        return -math.inf
+    relative = -0.691 + to_db(kept.mean()) + RELATIVE_GATE
+    kept = windows[(levels > ABSOLUTE_GATE) & (levels > relative)]
+    return -0.691 + to_db(kept.mean())
+
+
+def measure(node, start_ms=0, end_ms=None, check=None):
+    # Peak and RMS in dBFS and integrated loudness in LUFS of a range of the node
+    end = node.frame_count if end_ms is None else node.ms_to_frame(end_ms)
+    parts = list(collect(node, node.ms_to_frame(start_ms), end, check=check))
+    if not parts:
+        return {"peak": -math.inf, "rms": -math.inf, "lufs": -math.inf}
+    peak, squares, weighted, frames = (np.concatenate(part) for part in zip(*parts))
+    peak = min(1.0, peak.max())  # As exported
+    return {
+        "peak": 20 * math.log10(peak) if peak > 0 else -math.inf,
+        "rms": to_db(squares.sum() / max(1, frames.sum() * node.channels)),
+        "lufs": integrated(weighted, frames),
+    }
+
+
+def normalization_gain(node, target=-14.0, peak_limit=None, check=None):
+    # dB to add to reach `target` LUFS, kept low enough that the peak stays under peak_limit dBFS
+    levels = measure(node, check=check)
+    if not math.isfinite(levels["lufs"]):
+        return 0.0  # Silence
+    gain = target - levels["lufs"]
+    if peak_limit is not None and math.isfinite(levels["peak"]):
+        gain = min(gain, peak_limit - levels["peak"])
+    return gain
+
+
+def normalize(node, target=-14.0, peak_limit=None):
+    return node + normalization_gain(node, target, peak_limit)
+
+
+def describe(levels):
+    return f"Peak {levels['peak']:.1f} dBFS  RMS {levels['rms']:.1f} dBFS  {levels['lufs']:.1f} LUFS"
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from edits import Concat, Node, Slice
+
+
+class Crossfade(Node):
+    # Equal-length overlap of the end of one node and the start of the next, faded
+    # linearly out and in
+    def __init__(self, outgoing, incoming):
+        self.outgoing = outgoing
+        self.incoming = incoming
+        self.children = [outgoing, incoming]
+        self.frame_rate = outgoing.frame_rate
+        self.channels = outgoing.channels
+        self.sample_width = max(outgoing.sample_width, incoming.sample_width)
+        self.frame_count = min(outgoing.frame_count, incoming.frame_count)
+
+    def render(self, start, end):
+        start, end = max(0, start), min(end, self.frame_count)
+        if end <= start:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        fade_in = (np.arange(start, end, dtype=np.float32) / self.frame_count)[:, None]
+        out = self.outgoing.render(start, end) * (1 - fade_in)
+        out += self.incoming.render(start, end) * fade_in
+        return out
+
+
+def load_all(cache, paths, workers=None):
+    # Decoding is done by ffmpeg processes, so threads are enough to overlap them
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        return list(pool.map(cache.load, paths))
+
+
+def merge(nodes, crossfade_ms=0, frame_rate=None):
+    # Join any number of nodes in one pass. The result is a single Concat over slices
+    # of the inputs, so nothing is copied and the cost is linear in the number of
+    # inputs. Inputs are brought to one rate (the highest unless given) and channel
+    # count; with crossfade_ms each join overlaps the neighbours by that much. An input
+    # still being decoded is joined at whatever length it reaches, but a crossfade
+    # needs its final length, so callers wait for its decode first.
+    frame_rate = frame_rate or max(node.frame_rate for node in nodes)
+    channels = max(node.channels for node in nodes)
+    fade = int(crossfade_ms * frame_rate / 1000)
+    parts = []
+    for node in nodes:
+        node = node.set_frame_rate(frame_rate).set_channels(channels)
+        if node.frame_count == 0 and not node.growing:
+            continue
+        # Earlier merges are spliced in piece by piece so joins never nest
+        pieces = list(node.children) if isinstance(node, Concat) else [node]
+        if parts and fade:
+            previous, first = parts.pop(), pieces[0]
+            overlap = min(fade, previous.frame_count, first.frame_count)
+            parts.append(Slice(previous, 0, previous.frame_count - overlap))
+            parts.append(Crossfade(Slice(previous, previous.frame_count - overlap, previous.frame_count),
+                                   Slice(first, 0, overlap)))
+            pieces[0] = Slice(first, overlap, first.frame_count)
+        parts.extend(pieces)
+    parts = [part for part in parts if part.frame_count or part.growing]
+    if not parts:
+        return Slice(nodes[0], 0, 0)
+    return Concat(parts)
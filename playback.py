@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pygame
+
+
+class Player:
+    def __init__(self, block_ms=100):
+        self.block_ms = block_ms
+        self.reader = None
+        self.channel = None
+        self.thread = None
+        self.stopped = threading.Event()  # Replaced on each play, so a late thread never revives
+        self.start_ms = 0
+        self.started_at = 0
+        self.paused_at = None
+        self.paused_total = 0
+
+    def ensure_mixer(self, frame_rate, channels):
+        # Reopen the device only when the stream format changes
+        if pygame.mixer.get_init() != (frame_rate, -16, channels):
+            pygame.mixer.quit()
+            pygame.mixer.init(frequency=frame_rate, size=-16, channels=channels, buffer=512)
+            self.channel = pygame.mixer.Channel(0)
+
+    def warm(self, frame_rate=44100, channels=2):
+        # Open the device before the first play; play() reopens it only for another format
+        try:
+            self.ensure_mixer(frame_rate, channels)
+        except pygame.error as e:
+            print(f"Error opening the audio device: {e}")
+
+    def play(self, reader):
+        self.stop()
+        self.ensure_mixer(reader.frame_rate, reader.channels)
+        self.reader = reader
+        self.block_frames = max(1, reader.frame_rate * self.block_ms // 1000)
+        self.start_ms = reader.position * 1000 / reader.frame_rate
+        first = reader.read(self.block_frames)
+        if not first:
+            return
+        self.stopped = threading.Event()
+        self.paused_at = None
+        self.paused_total = 0
+        self.channel.play(pygame.mixer.Sound(buffer=first))
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self.feed, args=(reader, self.stopped), daemon=True)
+        self.thread.start()
+
+    def feed(self, reader, stopped):
+        # Keep one block queued behind the one that is playing
+        while not stopped.is_set():
+            if self.channel.get_queue() is None:
+                block = reader.read(self.block_frames)
+                if not block or stopped.is_set():
+                    break
+                self.channel.queue(pygame.mixer.Sound(buffer=block))
+            stopped.wait(self.block_ms / 4000)
+        while not stopped.is_set() and self.channel.get_busy():
+            stopped.wait(self.block_ms / 4000)
+
+    def pause(self):
+        if self.is_playing() and self.paused_at is None:
+            self.channel.pause()
+            self.paused_at = time.monotonic()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.channel.unpause()
+            self.paused_total += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def is_paused(self):
+        return self.paused_at is not None
+
+    def is_playing(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def position_ms(self):
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return self.start_ms + (now - self.started_at - self.paused_total) * 1000
+
+    def rebase(self, position_ms):
+        # The reader's timeline changed under it (a live speed change); count on from here
+        now = time.monotonic()
+        self.start_ms = position_ms
+        self.started_at = now
+        self.paused_total = 0
+        if self.paused_at is not None:
+            self.paused_at = now
+
+    def stop(self):
+        self.stopped.set()
+        if self.reader is not None:
+            self.reader.stop()
+        if self.channel is not None:
+            self.channel.stop()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            if self.thread.is_alive():
+                print("Failed to stop the playback thread.")
+        self.thread = None
+        self.paused_at = None
@@ -0,0 +1,52 @@
+class Playhead:
+    def __init__(self, master, canvas, waveform, progress, fps=30):
+        self.master = master
+        self.canvas = canvas
+        self.waveform = waveform
+        self.progress = progress
+        self.interval = max(1, int(1000 / fps))
+        self.player = None
+        self.duration = 0
+        self.background = None
+        self.job = None
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        # Every full redraw refreshes the cached background the cursor is blitted onto
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.draw_cursors()
+
+    def draw_cursors(self):
+        for ax, cursor in zip(self.waveform.axes, self.waveform.cursors):
+            ax.draw_artist(cursor)
+
+    def start(self, player, duration):
+        self.player = player
+        self.duration = duration
+        if self.job is None:
+            self.job = self.master.after(0, self.tick)
+
+    def stop(self):
+        if self.job is not None:
+            self.master.after_cancel(self.job)
+            self.job = None
+
+    def tick(self):
+        self.job = None
+        if self.player is None or not self.player.is_playing():
+            return
+        self.move(min(self.player.position_ms(), self.duration))
+        self.job = self.master.after(self.interval, self.tick)
+
+    def move(self, position):
+        # Position is in milliseconds, the same time base as the waveform axis
+        if self.duration > 0:
+            self.progress["value"] = position / self.duration * 100
+        self.waveform.set_cursor(position)
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_cursors()
+        for ax in self.waveform.axes:
+            self.canvas.blit(ax.bbox)
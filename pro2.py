@@ -1,39 +1,34 @@
 import tkinter as tk
 from tkinter import filedialog, simpledialog
 import tkinter.ttk as ttk
-import pygame
-from pydub import AudioSegment
-import tempfile
-import os
-import threading
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.io import wavfile
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import startup
+from tracing import span, traced, tracer
+from worker import BackgroundWorker
+
+# numpy, scipy, matplotlib, pydub and pygame take seconds to import, so the window is
+# shown first and these are imported on a background thread (see warm_up). Methods
+# import what they use from them locally; by then it is a lookup in sys.modules.
+HEAVY_MODULES = ["numpy", "scipy.signal", "pydub", "pygame", "matplotlib.figure",
+                 "matplotlib.backends.backend_tkagg", "cache", "engine", "export", "history",
+                 "loudness", "merge", "playback", "playhead", "seekindex", "spectrogram", "streaming",
+                 "waveform"]
 
 class AudioEditor:
     def __init__(self, master):
         self.master = master
         master.title("Audio Editor")
 
-        # Load the images
-        self.play_image = tk.PhotoImage(file="play.png")
-        self.stop_image = tk.PhotoImage(file="stop.png")
-        self.cut_image = tk.PhotoImage(file="cut.png")
-
-        self.play_image = self.play_image.subsample(10, 10)  # Reduce the size to half
-        self.stop_image = self.stop_image.subsample(10, 10)  # Reduce the size to half
-        self.cut_image = self.cut_image.subsample(10, 10)  # Reduce the size to half
-
-        # Create the buttons with the images
-        self.play_button = tk.Button(master, image=self.play_image, command=self.play_segment)
+        # Named until load_icons puts their images on after the first paint
+        self.play_button = tk.Button(master, text="Play", command=self.play_segment)
         self.play_button.grid(row=0, column=0, padx=5, pady=5)
 
-        self.stop_button = tk.Button(master, image=self.stop_image, command=self.stop_audio)
+        self.stop_button = tk.Button(master, text="Stop", command=self.stop_audio)
         self.stop_button.grid(row=0, column=1, padx=5, pady=5)
 
-        self.cut_button = tk.Button(master, image=self.cut_image, command=self.cut_dialog)
+        self.pause_button = tk.Button(master, text="Pause", command=self.toggle_pause)
+        self.pause_button.grid(row=0, column=2, padx=5, pady=5)
+
+        self.cut_button = tk.Button(master, text="Cut", command=self.cut_dialog)
         self.cut_button.grid(row=5, column=1, padx=5, pady=5)
 
         # Add a progress bar
@@ -42,24 +37,44 @@ class AudioEditor:
         self.progress = ttk.Progressbar(master, style="TProgressbar", orient="horizontal", length=200, mode="determinate")
         self.progress.grid(row=2, column=2)
 
-        # Add a canvas for the plot
-        self.figure = Figure(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
-        self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=3)
-        # Load the merge image
-        self.merge_image = tk.PhotoImage(file="merge.png")
-        self.merge_image = self.merge_image.subsample(10, 10)  # Reduce the size to half
-
-        # Create the merge button with the image
-        self.merge_button = tk.Button(master, image=self.merge_image, command=self.merge_dialog, bg='white', activebackground='black')
+        # Stands in for the plot until start_subsystems puts the canvas there
+        self.placeholder = tk.Frame(master, width=500, height=400)
+        self.placeholder.grid(row=1, column=0, columnspan=3)
+        self.figure = None
+        self.canvas = None
+        self.waveform = None
+        self.merge_button = tk.Button(master, text="Merge", command=self.merge_dialog, bg='white', activebackground='black')
         self.merge_button.grid(row=5, column=2, padx=0, pady=5)
         # Create the menu
         self.menu = tk.Menu(master)
         self.file_menu = tk.Menu(self.menu, tearoff=0)
         self.file_menu.add_command(label="Open", command=self.open_file)
         self.file_menu.add_command(label="Save", command=self.save_audio)
+        self.file_menu.add_command(label="Save in several formats", command=self.save_formats)
+        self.file_menu.add_command(label="Cancel export", command=self.cancel_export)
         self.menu.add_cascade(label="File", menu=self.file_menu)
+        self.edit_menu = tk.Menu(self.menu, tearoff=0)
+        self.edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
+        self.edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
+        self.edit_menu.add_command(label="Normalize loudness", command=self.normalize_dialog)
+        self.menu.add_cascade(label="Edit", menu=self.edit_menu)
+        self.spectrogram_var = tk.BooleanVar(value=False)
+        self.view_menu = tk.Menu(self.menu, tearoff=0)
+        self.view_menu.add_checkbutton(label="Spectrogram", variable=self.spectrogram_var, command=self.toggle_spectrogram)
+        self.menu.add_cascade(label="View", menu=self.view_menu)
+        master.bind_all("<Control-z>", self.undo)
+        master.bind_all("<Control-y>", self.redo)
+        self.trace_var = tk.BooleanVar(value=tracer.enabled)
+        self.overlay_var = tk.BooleanVar(value=False)
+        self.trace_menu = tk.Menu(self.menu, tearoff=0)
+        self.trace_menu.add_checkbutton(label="Record", variable=self.trace_var, command=self.toggle_tracing)
+        self.trace_menu.add_checkbutton(label="Show last operation", variable=self.overlay_var, command=self.toggle_overlay)
+        self.trace_menu.add_command(label="Save trace", command=self.save_trace)
+        self.menu.add_cascade(label="Trace", menu=self.trace_menu)
         master.config(menu=self.menu)
+        self.trace_label = tk.Label(master, justify=tk.LEFT, anchor='w', font=("Courier", 9))
+        self.loudness_label = tk.Label(master, anchor='w')
+        self.loudness_label.grid(row=3, column=2)
 
         self.speed_var = tk.StringVar()
         self.speed_var.set("1x")  # default value
@@ -75,72 +90,186 @@ class AudioEditor:
         frequency_label.grid(row=3, column=0)
         self.change_frequency_scale = tk.Scale(master, from_=1000, to=20000, orient=tk.HORIZONTAL, command=self.change_frequency)
         self.change_frequency_scale.grid(row=3, column=1)
+        self.change_frequency_scale.bind("<ButtonRelease-1>", self.slider_released)
 
         volume_label = tk.Label(master, text="Volume:")
         volume_label.grid(row=4, column=0)
         self.change_volume_scale = tk.Scale(master, from_=0.0, to=1.0, resolution=0.01, orient=tk.HORIZONTAL, command=self.change_volume)
         self.change_volume_scale.grid(row=4, column=1)
+        self.change_volume_scale.bind("<ButtonRelease-1>", self.slider_released)
 
         self.audio = None
-        self.play_thread = None
+        self.loader = None
+        self.cache = None  # Cache, player, playhead, exporter and history come from start_subsystems
+        self.player = None
+        self.engine = None
+        self.worker = BackgroundWorker(master)
+        self.analysis = BackgroundWorker(master)  # Long analyses get their own thread so redraws never queue behind them
+        self.playhead = None
+        self.play_position = 0  # Where playback starts, in milliseconds
+        self.exporter = None
+        self.history = None
+        self.spectrogram = None  # Created the first time it is shown
+        self.export_poll = None
+        self.warmup = None
+        master.bind("<Map>", self.on_map)
+
+    def on_map(self, event):
+        # First time the window is shown: let it paint, then fill in the rest
+        if event.widget is not self.master or self.warmup is not None:
+            return
+        self.master.update_idletasks()
+        startup.mark("first paint")
+        self.load_icons()
+        self.warm_up()
+
+    def load_icons(self):
+        self.icons = []
+        for button, path, factor in [(self.play_button, "play.png", 10), (self.stop_button, "stop.png", 10),
+                                     (self.pause_button, "img/pause50.png", 2), (self.cut_button, "cut.png", 10),
+                                     (self.merge_button, "merge.png", 10)]:
+            image = tk.PhotoImage(file=path).subsample(factor, factor)
+            button.config(image=image)
+            self.icons.append(image)  # Tk drops images Python no longer references
+
+    def warm_up(self):
+        if self.warmup is None:
+            self.warmup = startup.Warmup(HEAVY_MODULES)
+            self.master.after(50, self.poll_warmup)
+
+    def poll_warmup(self):
+        if not self.warmup.done():
+            self.master.after(50, self.poll_warmup)
+        elif self.cache is None:
+            self.start_subsystems()
+
+    def ensure_ready(self):
+        # For anything used before the warm-up has finished: wait for it here
+        if self.cache is None:
+            self.warm_up()
+            self.warmup.wait()
+            self.start_subsystems()
+
+    def start_subsystems(self):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from cache import DecodeCache
+        from export import Exporter
+        from history import History
+        from playback import Player
+        from playhead import Playhead
+        from waveform import WaveformView
+        self.figure = Figure(figsize=(5, 4), dpi=100)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.master)
+        self.placeholder.destroy()
+        self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=3)
+        self.canvas.mpl_connect('button_press_event', self.seek)
+        self.waveform = WaveformView(self.figure)
+        self.canvas.draw_idle()
+        self.cache = DecodeCache()
+        self.player = Player(block_ms=20)  # Live changes reach the speakers within a block or two
+        self.player.warm()
+        self.playhead = Playhead(self.master, self.canvas, self.waveform, self.progress)
+        self.exporter = Exporter()
+        self.history = History()
+        startup.mark("ready")
 
     def open_file(self):
+        self.ensure_ready()
+        from streaming import StreamingLoader
         self.audio_path = filedialog.askopenfilename()
-        self.audio = self.load(self.audio_path)
-        self.plot_waveform(self.audio_path)
+        with span("open", path=self.audio_path):
+            self.loader = StreamingLoader(self.cache, self.audio_path)
+        self.audio = self.loader.source  # Grows while the rest of the file is decoded
+        self.history.clear()
+        self.update_waveform()
+        self.master.after(250, self.poll_loading, self.loader)
+
+    def poll_loading(self, loader):
+        # Redraw as more of the file is decoded until it is complete
+        if loader is not self.loader:
+            return
+        self.playhead.duration = len(self.audio)  # The cursor may go as far as has been decoded
+        self.update_waveform()
+        if not loader.done():
+            self.master.after(250, self.poll_loading, loader)
 
     def load(self, input_file):
-        return AudioSegment.from_file(input_file)
+        return self.cache.load(input_file)
 
+    @traced("play")
     def play_segment(self):
+        from engine import Engine
         if self.audio:
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            temp_file.close()
-            self.audio.export(temp_file.name, format="mp3")
-            self.play_mp3(temp_file.name)
-            os.unlink(temp_file.name)
-
-    def play_mp3(self, file_path):
-        pygame.init()
-        try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-            self.play_thread = threading.Thread(target=self.wait_for_audio_to_finish)
-            self.play_thread.start()
-        except pygame.error as e:
-            print("Error playing audio:", e)
-
-    def wait_for_audio_to_finish(self):
-        while pygame.mixer.music.get_busy():
-            # Update the progress bar
-            position = pygame.mixer.music.get_pos()  # This is in milliseconds
-            duration = len(self.audio)  # This is also in milliseconds
-            self.progress["value"] = (position / duration) * 100
-
-            # Update the current position line
-            self.current_position_line.set_xdata(position / 1000 * self.audio.frame_rate)
-            self.canvas.draw()
-
-            pygame.time.Clock().tick(10)
+            position = self.play_position
+            if self.player.is_playing():
+                self.stop_audio()
+            node = self.audio
+            if node is self.loader.source:
+                node = self.loader.playable(position)
+            self.engine = Engine(node, position)
+            self.player.play(self.engine)
+            self.playhead.start(self.player, len(self.audio))
+
+    def toggle_pause(self):
+        self.ensure_ready()
+        if self.player.is_paused():
+            self.player.resume()
+        else:
+            self.player.pause()
+
+    @traced("seek")
+    def seek(self, event):
+        if self.audio is None or event.xdata is None:
+            return
+        self.play_position = max(0, min(event.xdata, len(self.audio)))
+        if self.player.is_playing():
+            self.play_segment()
+        else:
+            self.playhead.move(self.play_position)
 
+    @traced("stop")
     def stop_audio(self):
         if self.audio is not None:
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
-            if self.play_thread and self.play_thread.is_alive():
-                self.play_thread.join(timeout=1.0)  # Add a timeout
-                if self.play_thread.is_alive():  # If the thread is still alive after the timeout
-                    print("Failed to stop the play thread.")
-                    return  # Return early to avoid hanging the program
-            self.progress["value"] = 0
-            self.current_position_line.set_xdata(0)
-            self.canvas.draw()
+            self.player.stop()
+            self.playhead.stop()
+            self.play_position = 0
+            self.playhead.move(0)
 
     def save_audio(self):
+        from export import format_of
         if self.audio:
             save_path = filedialog.asksaveasfilename(defaultextension=".mp3")
-            self.audio.export(save_path, format="mp3")
+            if save_path:
+                self.start_export([(save_path, format_of(save_path), None)])
+
+    def save_formats(self):
+        from export import parse_targets
+        if self.audio:
+            save_path = filedialog.asksaveasfilename(defaultextension=".mp3")
+            spec = simpledialog.askstring("Input", "Formats to save (format:bitrate, ...):", initialvalue="mp3:192k, ogg, wav")
+            if save_path and spec:
+                self.start_export(parse_targets(save_path, spec))
+
+    @traced("export.start")
+    def start_export(self, targets):
+        # Encoding runs in the background; the progress bar follows it until every target is written
+        self.exporter.export(self.audio, targets)
+        if self.export_poll is None:
+            self.export_poll = self.master.after(100, self.poll_export)
+
+    def poll_export(self):
+        self.progress["value"] = self.exporter.progress() * 100
+        if self.exporter.busy():
+            self.export_poll = self.master.after(100, self.poll_export)
+        else:
+            self.export_poll = None
 
+    def cancel_export(self):
+        if self.exporter is not None:
+            self.exporter.cancel()
+
+    @traced("change_speed")
     def change_speed(self, event=None):
         try:
             speed = float(self.speed_var.get().strip('x'))
@@ -158,18 +287,19 @@ class AudioEditor:
                     if len(self.audio) < 1000:
                         print("Audio is too short to process.")
                         return
+                    before = self.state()
                     self.audio = self.audio.speedup(playback_speed=speed)
+                    self.history.record(before, self.state())
+                    self.update_engine(1 / speed)
                 except Exception as e:
                     print(f"Error changing speed: {e}")
                     return
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp:
-                self.audio.export(temp.name, format="wav")
-                self.plot_waveform(temp.name)  # Update the waveform
-                os.unlink(temp.name)  # Delete the temporary file
+            self.update_waveform()  # Update the waveform
         else:
             print("Audio data is not loaded or is too short.")
 
+    @traced("change_frequency")
     def change_frequency(self, event=None):
         try:
             frequency = int(event)
@@ -179,78 +309,207 @@ class AudioEditor:
 
         if self.audio is not None and len(self.audio) > 0:
             try:
+                before = self.state()
                 self.audio = self.audio.set_frame_rate(frequency)
+                self.history.record(before, self.state(), group='frequency')  # One undo step per slider drag
+                self.update_engine()
             except Exception as e:
                 print(f"Error changing frequency: {e}")
                 return
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp:
-                self.audio.export(temp.name, format="wav")
-                self.plot_waveform(temp.name)  # Update the waveform
-                os.unlink(temp.name)  # Delete the temporary file
+            self.update_waveform(preview=True)  # Coarse preview while the slider moves
         else:
             print("Audio data is not loaded or is too short.")
 
+    @traced("change_volume")
     def change_volume(self, volume):
         if self.audio is not None and len(self.audio) > 0:
             try:
                 volume = float(volume)
+                before = self.state()
                 self.audio = self.audio + volume
+                self.history.record(before, self.state(), group='volume')
+                self.update_engine()
 
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp:
-                    self.audio.export(temp.name, format="wav")
-                    self.plot_waveform(temp.name)  # Update the waveform
-                    os.unlink(temp.name)  # Delete the temporary file
+                self.update_waveform(preview=True)  # Coarse preview while the slider moves
             except Exception as e:
                 print(f"Error changing volume: {e}")
         else:
             print("Audio data is not loaded or is too short.")
 
     def merge_dialog(self):
-        audio_path_2 = filedialog.askopenfilename()
-        self.merge_audio(audio_path_2)
-    
-    def merge_audio(self, audio_path_2):
-        audio_2 = self.load(audio_path_2)
-        self.audio = self.audio + audio_2
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp:
-            self.audio.export(temp.name, format="wav")
-            self.plot_waveform(temp.name)  # Update the waveform
-            os.unlink(temp.name)  # Delete the temporary file
-
-    def convert_to_wav(self, audio_path):
-        audio = AudioSegment.from_file(audio_path)
-        wav_path = audio_path.rsplit('.', 1)[0] + '.wav'
-        audio.export(wav_path, format='wav')
-        return wav_path
-
-    def plot_waveform(self, audio_path):
-        wav_path = self.convert_to_wav(audio_path)
-        sample_rate, data = wavfile.read(wav_path)
-
-        # Create a time axis in milliseconds
-        duration = len(data) / sample_rate
-        time = np.linspace(0., duration, len(data)) * 1000  # Multiply by 1000 to convert to milliseconds
-
-        self.figure.clear()  # Clear the current plot
-        self.plot = self.figure.add_subplot(111)
-        self.plot.plot(time, data)  # Plot data against time
-
-        # Add a vertical line for the current position
-        self.current_position_line = self.plot.axvline(x=0, color='r')
-
-        self.canvas.draw()
+        audio_paths = filedialog.askopenfilenames()
+        if audio_paths:
+            crossfade = simpledialog.askinteger("Input", "Crossfade between files (in milliseconds):", initialvalue=0, minvalue=0)
+            self.merge_audio(audio_paths, crossfade or 0)
+
+    @traced("merge")
+    def merge_audio(self, audio_paths, crossfade_ms=0):
+        from merge import load_all, merge
+        # Files are decoded in parallel and joined in one pass without copying samples
+        if isinstance(audio_paths, str):
+            audio_paths = [audio_paths]
+        sources = load_all(self.cache, audio_paths)
+        if crossfade_ms and self.loader is not None:
+            self.loader.wait()  # The crossfade needs the final length of the file being decoded
+        before = self.state()
+        self.audio = merge([self.audio] + sources, crossfade_ms)
+        self.history.record(before, self.state())
+        self.update_waveform()  # Update the waveform
+
+    def normalize_dialog(self):
+        from loudness import normalization_gain
+        if self.audio is None:
+            return
+        target = simpledialog.askfloat("Input", "Target loudness (in LUFS):", initialvalue=-14.0)
+        if target is not None:
+            # Measured off the Tk thread: a speed change has to be rendered once to be measured
+            segment = self.audio
+            self.analysis.submit('normalize', lambda job: normalization_gain(segment, target, peak_limit=-1.0, check=job.check),
+                                 lambda gain: self.apply_normalization(segment, gain))  # Peaks stay 1 dB below full scale
+
+    @traced("normalize")
+    def apply_normalization(self, segment, gain):
+        if segment is not self.audio:
+            return  # Edited while it was being measured
+        before = self.state()
+        self.audio = self.audio + gain
+        self.history.record(before, self.state())
+        self.update_engine()
+        self.update_waveform()
+
+    def state(self):
+        return {'audio': self.audio}
+
+    @traced("undo")
+    def undo(self, event=None):
+        if self.audio is not None and self.history.can_undo():
+            self.restore(self.history.undo(self.state()))
+
+    @traced("redo")
+    def redo(self, event=None):
+        if self.audio is not None and self.history.can_redo():
+            self.restore(self.history.redo(self.state()))
+
+    def restore(self, state):
+        # Versions share their nodes and samples, so switching is just swapping references
+        self.audio = state['audio']
+        self.update_engine()
+        self.update_waveform()
+
+    def update_engine(self, scale=1.0):
+        # Playing audio switches to the edited graph at the same moment on its next block
+        if self.engine is None or not self.player.is_playing():
+            return
+        position = min(self.player.position_ms() * scale, len(self.audio))
+        self.engine.switch(self.audio, position)
+        self.player.rebase(position)
+        self.playhead.duration = len(self.audio)
+
+    def slider_released(self, event):
+        if self.history is not None:
+            self.history.end_group()
+        self.update_waveform()
+
+    def update_waveform(self, preview=False):
+        # The envelope is computed off the Tk thread; a newer request cancels an older one
+        segment = self.audio
+        if segment is None:
+            return
+        if self.spectrogram_var.get():
+            self.spectrogram.show(segment)
+        bins = self.waveform.pixel_width()
+        if preview:
+            bins //= 8
+        self.worker.submit('waveform', lambda job: self.compute_envelope(segment, bins),
+                           lambda result: self.show_waveform(segment, result), delay_ms=30 if preview else 0)
+        # Answered from the block statistics of the sources, so cheap enough for every change;
+        # on the analysis thread, as the first measure after a speed change renders it
+        self.analysis.submit('loudness', lambda job: self.measure_loudness(segment, job.check), self.show_loudness,
+                             delay_ms=30 if preview else 0)
+
+    def measure_loudness(self, segment, check=None):
+        from loudness import measure
+        with span("loudness"):
+            return measure(segment, check=check)
+
+    def show_loudness(self, levels):
+        from loudness import describe
+        self.loudness_label.config(text=describe(levels))
+
+    def compute_envelope(self, segment, bins):
+        from waveform import envelope
+        with span("envelope", bins=bins):
+            return envelope(segment, 0, segment.frame_count, bins)
+
+    @traced("show_waveform")
+    def show_waveform(self, segment, result):
+        self.waveform.update(segment, *result)
+        self.canvas.draw_idle()
 
     def cut_dialog(self):
+        if self.audio is None:
+            return
         start_time = simpledialog.askinteger("Input", "Enter start time (in milliseconds):")
         end_time = simpledialog.askinteger("Input", "Enter end time (in milliseconds):")
-        self.audio = self.audio[start_time:end_time]
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp:
-            self.audio.export(temp.name, format="wav")
-            self.plot_waveform(temp.name)  # Update the waveform
-            os.unlink(temp.name)  # Delete the temporary file
-
-root = tk.Tk()
-audio_editor = AudioEditor(root)
-root.mainloop()
+        if start_time is None or end_time is None:
+            return  # Cancelled
+        with span("cut"):
+            before = self.state()
+            if self.audio is self.loader.source:
+                self.audio = self.loader.range(start_time, end_time)  # Need not wait for the decode to get there
+            else:
+                self.audio = self.audio[start_time:end_time]
+            self.history.record(before, self.state())
+            self.update_waveform()  # Update the waveform
+
+    def toggle_spectrogram(self):
+        # Shown next to the waveform; scroll to zoom, shift+scroll to move along the timeline
+        self.ensure_ready()
+        if self.spectrogram is None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from matplotlib.figure import Figure
+            from spectrogram import SpectrogramView
+            figure = Figure(figsize=(5, 4), dpi=100)
+            canvas = FigureCanvasTkAgg(figure, master=self.master)
+            self.spectrogram = SpectrogramView(self.master, canvas)
+        widget = self.spectrogram.canvas.get_tk_widget()
+        if self.spectrogram_var.get():
+            widget.grid(row=1, column=3)
+            if self.audio is not None:
+                self.spectrogram.show(self.audio)
+        else:
+            widget.grid_remove()
+
+    def toggle_tracing(self):
+        if self.trace_var.get():
+            tracer.enable()
+        else:
+            tracer.disable()
+
+    def toggle_overlay(self):
+        if self.overlay_var.get():
+            self.trace_label.grid(row=6, column=0, columnspan=3, sticky='w')
+            self.update_overlay()
+        else:
+            self.trace_label.grid_remove()
+
+    def update_overlay(self):
+        # Breakdown of the last traced operation, refreshed while the overlay is shown
+        if not self.overlay_var.get():
+            return
+        self.trace_label.config(text=tracer.breakdown() or "Nothing traced yet (Trace > Record).")
+        self.master.after(500, self.update_overlay)
+
+    def save_trace(self):
+        save_path = filedialog.asksaveasfilename(defaultextension=".json")
+        if save_path:
+            tracer.export_chrome(save_path)
+
+if __name__ == "__main__":
+    args = startup.parse_args()
+    root = tk.Tk()
+    audio_editor = AudioEditor(root)
+    if args.startup_time:
+        startup.measure(root, args.budget)
+    root.mainloop()
@@ -0,0 +1,184 @@
+import mmap
+import os
+import subprocess
+
+import numpy as np
+from pydub import AudioSegment
+
+import dsp
+from edits import Node, Source
+from streaming import decode_chunks
+from tracing import span, traced
+
+BITRATES = {1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1, kbit/s
+            2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]}  # MPEG-2 and 2.5
+FRAME_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+RESERVOIR_BYTES = 1024  # A frame's data may start up to 511 bytes back in earlier frames
+DECODER_DELAY = 529  # Samples ffmpeg skips on top of the encoder delay
+
+
+def frame_header(data, pos):
+    # (frame bytes, frame rate, samples per frame, channels) of the layer III frame
+    # header at `pos`, or None if there is no valid one there
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version, layer = (data[pos + 1] >> 3) & 3, (data[pos + 1] >> 1) & 3
+    bitrate, rate, padding = data[pos + 2] >> 4, (data[pos + 2] >> 2) & 3, (data[pos + 2] >> 1) & 1
+    if version == 1 or layer != 1 or bitrate in (0, 15) or rate == 3:
+        return None
+    frame_rate = FRAME_RATES[version][rate]
+    kbps = BITRATES[1 if version == 3 else 2][bitrate]
+    size = (144 if version == 3 else 72) * kbps * 1000 // frame_rate + padding
+    return size, frame_rate, 1152 if version == 3 else 576, 1 if data[pos + 3] >> 6 == 3 else 2
+
+
+def info_padding(data, pos, size):
+    # Samples ffmpeg drops from the start and end of the file when the frame at `pos` is
+    # a Xing/Info header (from the encoder delay and padding of a LAME extension, less or
+    # plus the decoder delay), or None if the frame holds audio
+    tag = max(data.find(b"Xing", pos, pos + 64), data.find(b"Info", pos, pos + 64))
+    if tag < 0:
+        return None
+    flags = int.from_bytes(data[tag + 4:tag + 8], "big")
+    extension = tag + 8 + 4 * (flags & 1) + 4 * (flags >> 1 & 1) + 100 * (flags >> 2 & 1) + 4 * (flags >> 3 & 1)
+    if extension + 24 > pos + size or data[extension:extension + 4] not in (b"LAME", b"Lavf", b"Lavc"):
+        return 0, 0
+    padding = int.from_bytes(data[extension + 21:extension + 24], "big")
+    return (padding >> 12) + DECODER_DELAY, max(0, (padding & 0xFFF) - DECODER_DELAY)
+
+
+class SeekIndex:
+    # Byte offset of every frame of an MP3, so a range of samples can be decoded from
+    # just the frames that cover it. Frame k holds decoder output samples
+    # [k * samples_per_frame, (k + 1) * samples_per_frame); sample n of the file as
+    # ffmpeg decodes it whole is decoder output sample n + skip, and the last `trim`
+    # samples of the output are padding.
+    def __init__(self, path, offsets, frame_rate, channels, samples_per_frame, skip, trim):
+        self.path = path
+        self.offsets = offsets  # One per frame plus the end of the last frame
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.samples_per_frame = samples_per_frame
+        self.skip = skip
+        self.trim = trim
+        self.frame_count = max(0, (len(offsets) - 1) * samples_per_frame - skip - trim)
+
+    @classmethod
+    @traced("seek.build")
+    def build(cls, path):
+        # Walks the frame headers; only their bytes are touched
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pos = 0
+            if data[:3] == b"ID3":
+                pos = 10 + (data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]) + (10 if data[5] & 0x10 else 0)
+            offsets = []
+            first = None
+            while pos < len(data):
+                header = frame_header(data, pos)
+                following = header and (pos + header[0] >= len(data) or frame_header(data, pos + header[0]))
+                if not following:
+                    if offsets:
+                        break  # Trailing tags
+                    pos += 1  # Junk before the first frame
+                    continue
+                if first is None:
+                    first = header
+                    padding = info_padding(data, pos, header[0])
+                    if padding is not None:
+                        pos += header[0]
+                        continue
+                offsets.append(pos)
+                pos += header[0]
+            if not offsets:
+                raise ValueError(f"No MP3 frames found in {path}")
+            offsets.append(min(pos, len(data)))
+        _, frame_rate, samples_per_frame, channels = first
+        return cls(path, np.array(offsets, dtype=np.int64), frame_rate, channels, samples_per_frame, *(padding or (0, 0)))
+
+    @classmethod
+    def load(cls, index_path, path):
+        with np.load(index_path) as data:
+            return cls(path, data["offsets"], int(data["frame_rate"]), int(data["channels"]),
+                       int(data["samples_per_frame"]), int(data["skip"]), int(data["trim"]))
+
+    def save(self, index_path):
+        with open(index_path, "wb") as f:
+            np.savez(f, offsets=self.offsets, frame_rate=self.frame_rate, channels=self.channels,
+                     samples_per_frame=self.samples_per_frame, skip=self.skip, trim=self.trim)
+
+    def first_frame(self, start):
+        # Frame to start decoding at for output sample `start`: the frame before the one
+        # holding it (for the overlap of the synthesis filter), and further back until
+        # the bit reservoir those frames may draw on is included
+        needed = (start + self.skip) // self.samples_per_frame
+        first = max(0, needed - 1)
+        while first > 0 and self.offsets[needed] - self.offsets[first] < RESERVOIR_BYTES:
+            first -= 1
+        return first
+
+    def decode(self, start, end):
+        # Samples [start, end) as int16 (frames, channels), decoding only the frames that cover them
+        start, end = max(0, start), min(end, self.frame_count)
+        if end <= start:
+            return np.zeros((0, self.channels), dtype=np.int16)
+        first = self.first_frame(start)
+        last = min(len(self.offsets) - 1, -(-(end + self.skip) // self.samples_per_frame))
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[first])
+            data = f.read(self.offsets[last] - self.offsets[first])
+        command = [AudioSegment.converter, "-v", "error", "-f", "mp3", "-i", "pipe:0", "-f", "s16le",
+                   "-acodec", "pcm_s16le", "-ac", str(self.channels), "-ar", str(self.frame_rate), "-"]
+        with span("decode.range", frames=end - start) as decoding:
+            result = subprocess.run(command, input=data, capture_output=True)
+            decoding.add_bytes(len(result.stdout))
+        if result.returncode != 0:
+            raise RuntimeError(f"Decoding {self.path} failed: {result.stderr.decode(errors='replace').strip()}")
+        samples = np.frombuffer(result.stdout, dtype=np.int16).reshape(-1, self.channels)
+        offset = start + self.skip - first * self.samples_per_frame
+        return samples[offset:offset + end - start]
+
+    def stream(self, start, frames):
+        # Consecutive int16 blocks from sample `start` to the end, from one decoder
+        start = max(0, start)
+        if start >= self.frame_count:
+            return
+        first = self.first_frame(start)
+        drop = start + self.skip - first * self.samples_per_frame
+        remaining = self.frame_count - start
+        for block in decode_chunks(self.path, self.frame_rate, self.channels, frames, int(self.offsets[first])):
+            skipped = min(drop, len(block))
+            block, drop = block[skipped:remaining + skipped], drop - skipped
+            if len(block):
+                yield block
+                remaining -= len(block)
+            if remaining <= 0:
+                return
+
+    def source(self, start_ms, end_ms):
+        # A range as a source of its own, decoded now
+        start, end = int(start_ms * self.frame_rate / 1000), int(end_ms * self.frame_rate / 1000)
+        return Source(self.decode(start, end), self.frame_rate, 2)
+
+    def node(self):
+        return CompressedSource(self)
+
+
+class CompressedSource(Node):
+    # The whole file as a node that decodes only what is rendered or streamed
+    def __init__(self, index):
+        self.index = index
+        self.frame_rate = index.frame_rate
+        self.channels = index.channels
+        self.sample_width = 2
+        self.frame_count = index.frame_count
+
+    def render(self, start, end):
+        return dsp.to_float(self.index.decode(start, end), 2)
+
+    def stream(self, start, frames, stopped=None):
+        for block in self.index.stream(start, frames):
+            yield dsp.to_float(block, 2)
+
+
+def is_mp3(path):
+    return os.path.splitext(path)[1].lower() == ".mp3"
@@ -1,38 +1,34 @@
 import tkinter as tk
 from tkinter import filedialog, simpledialog
 import tkinter.ttk as ttk
-import pygame
-from pydub import AudioSegment
-import tempfile
-import os
-import threading
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.io import wavfile
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
+import startup
+from tracing import span, traced, tracer
+from worker import BackgroundWorker
+
+# numpy, scipy, matplotlib, pydub and pygame take seconds to import, so the window is
+# shown first and these are imported on a background thread (see warm_up). Methods
+# import what they use from them locally; by then it is a lookup in sys.modules.
+HEAVY_MODULES = ["numpy", "scipy.signal", "pydub", "pygame", "matplotlib.figure",
+                 "matplotlib.backends.backend_tkagg", "cache", "engine", "export", "history",
+                 "loudness", "merge", "playback", "playhead", "seekindex", "silence", "spectrogram",
+                 "streaming", "waveform"]
+
 class AudioEditor:
     def __init__(self, master):
         self.master = master
         master.title("Audio Editor")
 
-        # Load the images
-        self.play_image = tk.PhotoImage(file="play.png")
-        self.stop_image = tk.PhotoImage(file="stop.png")
-        self.cut_image = tk.PhotoImage(file="cut.png")
-
-        self.play_image = self.play_image.subsample(10, 10)  # Reduce the size to half
-        self.stop_image = self.stop_image.subsample(10, 10)  # Reduce the size to half
-        self.cut_image = self.cut_image.subsample(10, 10)  # Reduce the size to half
-
-        # Create the buttons with the images
-        self.play_button = tk.Button(master, image=self.play_image, command=self.play_segment)
+        # Named until load_icons puts their images on after the first paint
+        self.play_button = tk.Button(master, text="Play", command=self.play_segment)
         self.play_button.grid(row=0, column=0, padx=5, pady=5)
 
-        self.stop_button = tk.Button(master, image=self.stop_image, command=self.stop_audio)
+        self.stop_button = tk.Button(master, text="Stop", command=self.stop_audio)
         self.stop_button.grid(row=0, column=1, padx=5, pady=5)
 
-        self.cut_button = tk.Button(master, image=self.cut_image, command=self.cut_dialog)
+        self.pause_button = tk.Button(master, text="Pause", command=self.toggle_pause)
+        self.pause_button.grid(row=0, column=2, padx=5, pady=5)
+
+        self.cut_button = tk.Button(master, text="Cut", command=self.cut_dialog)
         self.cut_button.grid(row=5, column=1, padx=5, pady=5)
 
         # Add a progress bar
@@ -42,24 +38,46 @@ class AudioEditor:
         self.progress = ttk.Progressbar(master, style="Custom.Horizontal.TProgressbar", orient="horizontal", length=200, mode="determinate")
         self.progress.grid(row=2, column=2)
 
-        # Add a canvas for the plot
-        self.figure = Figure(figsize=(5, 4), dpi=100)
-        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
-        self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=3)
-        # Load the merge image
-        self.merge_image = tk.PhotoImage(file="merge.png")
-        self.merge_image = self.merge_image.subsample(10, 10)  # Reduce the size to half
-
-        # Create the merge button with the image
-        self.merge_button = tk.Button(master, image=self.merge_image, command=self.merge_dialog, bg='white', activebackground='black')
+        # Stands in for the plot until start_subsystems puts the canvas there
+        self.placeholder = tk.Frame(master, width=500, height=400)
+        self.placeholder.grid(row=1, column=0, columnspan=3)
+        self.figure = None
+        self.canvas = None
+        self.waveform = None
+        self.merge_button = tk.Button(master, text="Merge", command=self.merge_dialog, bg='white', activebackground='black')
         self.merge_button.grid(row=5, column=2, padx=0, pady=5)
         # Create the menu
         self.menu = tk.Menu(master)
         self.file_menu = tk.Menu(self.menu, tearoff=0)
         self.file_menu.add_command(label="Open", command=self.open_file)
         self.file_menu.add_command(label="Save", command=self.save_audio)
+        self.file_menu.add_command(label="Save in several formats", command=self.save_formats)
+        self.file_menu.add_command(label="Save segments", command=self.save_segments)
+        self.file_menu.add_command(label="Cancel export", command=self.cancel_export)
         self.menu.add_cascade(label="File", menu=self.file_menu)
+        self.edit_menu = tk.Menu(self.menu, tearoff=0)
+        self.edit_menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo)
+        self.edit_menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo)
+        self.edit_menu.add_command(label="Normalize loudness", command=self.normalize_dialog)
+        self.edit_menu.add_command(label="Find segments", command=self.find_segments)
+        self.menu.add_cascade(label="Edit", menu=self.edit_menu)
+        self.spectrogram_var = tk.BooleanVar(value=False)
+        self.view_menu = tk.Menu(self.menu, tearoff=0)
+        self.view_menu.add_checkbutton(label="Spectrogram", variable=self.spectrogram_var, command=self.toggle_spectrogram)
+        self.menu.add_cascade(label="View", menu=self.view_menu)
+        master.bind_all("<Control-z>", self.undo)
+        master.bind_all("<Control-y>", self.redo)
+        self.trace_var = tk.BooleanVar(value=tracer.enabled)
+        self.overlay_var = tk.BooleanVar(value=False)
+        self.trace_menu = tk.Menu(self.menu, tearoff=0)
+        self.trace_menu.add_checkbutton(label="Record", variable=self.trace_var, command=self.toggle_tracing)
+        self.trace_menu.add_checkbutton(label="Show last operation", variable=self.overlay_var, command=self.toggle_overlay)
+        self.trace_menu.add_command(label="Save trace", command=self.save_trace)
+        self.menu.add_cascade(label="Trace", menu=self.trace_menu)
         master.config(menu=self.menu)
+        self.trace_label = tk.Label(master, justify=tk.LEFT, anchor='w', font=("Courier", 9))
+        self.loudness_label = tk.Label(master, anchor='w')
+        self.loudness_label.grid(row=3, column=2)
 
         self.speed_var = tk.StringVar()
         self.speed_var.set("1x")  # default value
@@ -76,97 +94,225 @@ class AudioEditor:
         self.change_frequency_scale = tk.Scale(master, from_=2000, to=50000, orient=tk.HORIZONTAL, command=self.change_frequency)
         self.change_frequency_scale.set(44100)  # Set default frequency to 44100 Hz
         self.change_frequency_scale.grid(row=3, column=1)
+        self.change_frequency_scale.bind("<ButtonRelease-1>", self.slider_released)
 
         volume_label = tk.Label(master, text="Volume:")
         volume_label.grid(row=4, column=0)
         self.change_volume_scale = tk.Scale(master, from_=0.0, to=100.0, resolution=0.01, orient=tk.HORIZONTAL, command=self.change_volume)
         self.change_volume_scale.grid(row=4, column=1)
+        self.change_volume_scale.bind("<ButtonRelease-1>", self.slider_released)
 
         self.audio = None
+        self.loader = None
         self.segment = None
-        self.original_segment = None
+        self.original_segment = None  # The cut and merged audio before speed, frequency and volume
+        self.speed = 1.0
+        self.frequency = None
+        self.volume = 0.0
         self.start_time = 0
         self.end_time = 0
-        self.play_thread = None
+        self.cache = None  # Cache, player, playhead, exporter and history come from start_subsystems
+        self.player = None
+        self.engine = None
+        self.worker = BackgroundWorker(master)
+        self.analysis = BackgroundWorker(master)  # Long analyses get their own thread so redraws never queue behind them
+        self.playhead = None
+        self.play_position = 0  # Where playback starts, in milliseconds
+        self.exporter = None
+        self.history = None
+        self.spectrogram = None  # Created the first time it is shown
+        self.segments = []  # [start_ms, end_ms] of the sound between silences
+        self.export_poll = None
+        self.warmup = None
+        master.bind("<Map>", self.on_map)
+
+    def on_map(self, event):
+        # First time the window is shown: let it paint, then fill in the rest
+        if event.widget is not self.master or self.warmup is not None:
+            return
+        self.master.update_idletasks()
+        startup.mark("first paint")
+        self.load_icons()
+        self.warm_up()
+
+    def load_icons(self):
+        self.icons = []
+        for button, path, factor in [(self.play_button, "play.png", 10), (self.stop_button, "stop.png", 10),
+                                     (self.pause_button, "img/pause50.png", 2), (self.cut_button, "cut.png", 10),
+                                     (self.merge_button, "merge.png", 10)]:
+            image = tk.PhotoImage(file=path).subsample(factor, factor)
+            button.config(image=image)
+            self.icons.append(image)  # Tk drops images Python no longer references
+
+    def warm_up(self):
+        if self.warmup is None:
+            self.warmup = startup.Warmup(HEAVY_MODULES)
+            self.master.after(50, self.poll_warmup)
+
+    def poll_warmup(self):
+        if not self.warmup.done():
+            self.master.after(50, self.poll_warmup)
+        elif self.cache is None:
+            self.start_subsystems()
+
+    def ensure_ready(self):
+        # For anything used before the warm-up has finished: wait for it here
+        if self.cache is None:
+            self.warm_up()
+            self.warmup.wait()
+            self.start_subsystems()
+
+    def start_subsystems(self):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from cache import DecodeCache
+        from export import Exporter
+        from history import History
+        from playback import Player
+        from playhead import Playhead
+        from waveform import WaveformView
+        self.figure = Figure(figsize=(5, 4), dpi=100)
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.master)
+        self.placeholder.destroy()
+        self.canvas.get_tk_widget().grid(row=1, column=0, columnspan=3)
+        self.canvas.mpl_connect('button_press_event', self.seek)
+        self.waveform = WaveformView(self.figure, color='gray')
+        self.canvas.draw_idle()
+        self.cache = DecodeCache()
+        self.player = Player(block_ms=20)  # Live changes reach the speakers within a block or two
+        self.player.warm()
+        self.playhead = Playhead(self.master, self.canvas, self.waveform, self.progress)
+        self.exporter = Exporter()
+        self.history = History()
+        startup.mark("ready")
 
     def open_file(self):
+        self.ensure_ready()
+        from streaming import StreamingLoader
         self.audio_path = filedialog.askopenfilename()
-        self.audio = self.load(self.audio_path)
+        with span("open", path=self.audio_path):
+            self.loader = StreamingLoader(self.cache, self.audio_path)
+        self.audio = self.loader.source  # Grows while the rest of the file is decoded
         self.segment = self.audio
         self.original_segment = self.segment
+        self.speed = 1.0
+        self.frequency = None
+        self.volume = 0.0
         self.start_time = 0
         self.end_time = len(self.audio)
-        self.plot_waveform(self.audio_path)
+        self.history.clear()
+        self.update_waveform()
+        self.master.after(250, self.poll_loading, self.loader)
+
+    def poll_loading(self, loader):
+        # Redraw as more of the file is decoded until it is complete
+        if loader is not self.loader:
+            return
+        self.end_time = len(self.audio)
+        self.playhead.duration = len(self.segment)  # The cursor may go as far as has been decoded
+        self.update_waveform()
+        if not loader.done():
+            self.master.after(250, self.poll_loading, loader)
 
     def load(self, input_file):
-        return AudioSegment.from_file(input_file)
+        return self.cache.load(input_file)
 
+    @traced("play")
     def play_segment(self):
+        from engine import Engine
         if self.segment:
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            temp_file.close()
-            self.segment.export(temp_file.name, format="mp3")
-            self.play_mp3(temp_file.name)
-            os.unlink(temp_file.name)
-
-    def play_mp3(self, file_path):
-        pygame.init()
-        try:
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-            self.play_thread = threading.Thread(target=self.wait_for_audio_to_finish)
-            self.play_thread.start()
-        except pygame.error as e:
-            print("Error playing audio:", e)
-
-    def wait_for_audio_to_finish(self):
-        while pygame.mixer.music.get_busy():
-            # Update the progress bar
-            position = pygame.mixer.music.get_pos()  # This is in milliseconds
-            duration = len(self.segment)  # This is also in milliseconds
-            self.progress["value"] = (position / duration) * 100
-
-            # Update the current position line
-            self.current_position_line.set_xdata(position / 1000 * self.segment.frame_rate)
-            self.canvas.draw()
-
-            pygame.time.Clock().tick(10)
+            position = self.play_position
+            if self.player.is_playing():
+                self.stop_audio()
+            node = self.original_segment
+            if node is self.audio:
+                node = self.loader.playable(position * self.speed)
+            # The engine applies speed, frequency and volume live on top of the unprocessed audio
+            self.engine = Engine(node, position * self.speed, speed=self.speed,
+                                 frequency=self.frequency, volume=self.volume)
+            self.player.play(self.engine)
+            self.playhead.start(self.player, len(self.segment))
+
+    def toggle_pause(self):
+        self.ensure_ready()
+        if self.player.is_paused():
+            self.player.resume()
+        else:
+            self.player.pause()
 
+    @traced("seek")
+    def seek(self, event):
+        if self.segment is None or event.xdata is None:
+            return
+        self.play_position = max(0, min(event.xdata, len(self.segment)))
+        if self.player.is_playing():
+            self.play_segment()
+        else:
+            self.playhead.move(self.play_position)
+
+    @traced("stop")
     def stop_audio(self):
         if self.audio is not None:
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.stop()
-            if self.play_thread and self.play_thread.is_alive():
-                self.play_thread.join(timeout=1.0)  # Add a timeout
-                if self.play_thread.is_alive():  # If the thread is still alive after the timeout
-                    print("Failed to stop the play thread.")
-                    return  # Return early to avoid hanging the program
-            self.progress["value"] = 0
-            self.current_position_line.set_xdata(0)
-            self.canvas.draw()
+            self.player.stop()
+            self.playhead.stop()
+            self.play_position = 0
+            self.playhead.move(0)
 
     def save_audio(self):
-        if self.audio:
+        from export import format_of
+        if self.segment:
+            save_path = filedialog.asksaveasfilename(defaultextension=".mp3")
+            if save_path:
+                self.start_export([(save_path, format_of(save_path), None)])
+
+    def save_formats(self):
+        from export import parse_targets
+        if self.segment:
             save_path = filedialog.asksaveasfilename(defaultextension=".mp3")
-            self.audio.export(save_path, format="mp3")
+            spec = simpledialog.askstring("Input", "Formats to save (format:bitrate, ...):", initialvalue="mp3:192k, ogg, wav")
+            if save_path and spec:
+                self.start_export(parse_targets(save_path, spec))
+
+    @traced("export.start")
+    def start_export(self, targets, node=None):
+        # Encoding runs in the background; the progress bar follows it until every target is written
+        self.exporter.export(node if node is not None else self.segment, targets)
+        if self.export_poll is None:
+            self.export_poll = self.master.after(100, self.poll_export)
+
+    def poll_export(self):
+        self.progress["value"] = self.exporter.progress() * 100
+        if self.exporter.busy():
+            self.export_poll = self.master.after(100, self.poll_export)
+        else:
+            self.export_poll = None
+
+    def cancel_export(self):
+        if self.exporter is not None:
+            self.exporter.cancel()
 
+    @traced("change_speed")
     def change_speed(self, event=None):
         try:
             speed = float(self.speed_var.get().strip('x'))
         except ValueError:
             print("Invalid speed value.")
             return
-        if speed < 0:
-            print("Speed value must be greater than or equal to zero.")
+        if speed <= 0:
+            print("Speed value must be greater than zero.")
             return
         if self.segment is not None and len(self.segment) > 0:
-            if speed != 1:
+            if speed != self.speed:
                 try:
                     # Ensure the segment length is sufficient for processing
                     if len(self.segment) < 1000:
                         print("Segment is too short to process.")
                         return
-                    self.segment = self.original_segment.speedup(playback_speed=speed)
+                    before = self.state()
+                    old_speed, self.speed = self.speed, speed
+                    self.apply_effects()
+                    self.history.record(before, self.state())
+                    self.update_engine(old_speed)
                 except Exception as e:
                     print(f"Error changing speed: {e}")
                     return
@@ -176,6 +322,7 @@ class AudioEditor:
         else:
             print("Audio segment is not loaded or is too short.")
 
+    @traced("change_frequency")
     def change_frequency(self, event=None):
         try:
             frequency = int(event)
@@ -185,23 +332,32 @@ class AudioEditor:
 
         if self.segment is not None and len(self.segment) > 0:
             try:
-                self.segment = self.original_segment.set_frame_rate(frequency)
+                before = self.state()
+                self.frequency = frequency
+                self.apply_effects()
+                self.history.record(before, self.state(), group='frequency')  # One undo step per slider drag
+                self.update_engine()
             except Exception as e:
                 print(f"Error changing frequency: {e}")
                 return
 
-            self.update_waveform()  # Update the waveform without saving
+            self.update_waveform(preview=True)  # Coarse preview while the slider moves
 
         else:
             print("Audio segment is not loaded or is too short.")
 
+    @traced("change_volume")
     def change_volume(self, volume):
         if self.segment is not None and len(self.segment) > 0:
             try:
                 volume = float(volume)
-                self.segment = self.original_segment + volume
+                before = self.state()
+                self.volume = volume
+                self.apply_effects()
+                self.history.record(before, self.state(), group='volume')
+                self.update_engine()
 
-                self.update_waveform()  # Update the waveform without saving
+                self.update_waveform(preview=True)  # Coarse preview while the slider moves
 
             except Exception as e:
                 print(f"Error changing volume: {e}")
@@ -209,67 +365,248 @@ class AudioEditor:
             print("Audio segment is not loaded or is too short.")
 
     def merge_dialog(self):
-        audio_path_2 = filedialog.askopenfilename()
-        if audio_path_2:
-            self.merge_audio(audio_path_2)
-
-    def merge_audio(self, audio_path_2):
-        audio_2 = self.load(audio_path_2)
-        self.segment = self.segment + audio_2
+        audio_paths = filedialog.askopenfilenames()
+        if audio_paths:
+            crossfade = simpledialog.askinteger("Input", "Crossfade between files (in milliseconds):", initialvalue=0, minvalue=0)
+            self.merge_audio(audio_paths, crossfade or 0)
+
+    @traced("merge")
+    def merge_audio(self, audio_paths, crossfade_ms=0):
+        from merge import load_all, merge
+        # Files are decoded in parallel and joined in one pass without copying samples
+        if isinstance(audio_paths, str):
+            audio_paths = [audio_paths]
+        sources = load_all(self.cache, audio_paths)
+        if crossfade_ms and self.loader is not None:
+            self.loader.wait()  # The crossfade needs the final length of the file being decoded
+        before = self.state()
+        self.original_segment = merge([self.original_segment] + sources, crossfade_ms)
+        self.apply_effects()
+        self.history.record(before, self.state())
 
         self.update_waveform()  # Update the waveform without saving
 
-    def update_waveform(self):
-        # Plot the waveform of the current segment
-        sample_rate, data = self.segment.frame_rate, np.array(self.segment.get_array_of_samples())
-        duration = len(data) / sample_rate
-        time = np.linspace(0., duration, len(data)) * 1000  # Convert to milliseconds
-
-        self.figure.clear()  # Clear the current plot
-        self.plot = self.figure.add_subplot(111)
-        self.plot.plot(time, data)  # Plot data against time
-
-        # Add a vertical line for the current position
-        self.current_position_line = self.plot.axvline(x=0, color='r')
-
-        self.canvas.draw()
+    @traced("apply_effects")
+    def apply_effects(self):
+        # Edits are lazy, so rebuilding the chain from the unprocessed audio costs nothing
+        segment = self.original_segment.speedup(playback_speed=self.speed)
+        if self.frequency:
+            segment = segment.set_frame_rate(self.frequency)
+        self.segment = segment + self.volume
+        if self.segments:
+            self.segments = []  # Boundaries found on the previous version no longer apply
+            self.waveform.set_markers([])
+
+    def normalize_dialog(self):
+        from loudness import normalization_gain
+        if self.segment is None:
+            return
+        target = simpledialog.askfloat("Input", "Target loudness (in LUFS):", initialvalue=-14.0)
+        if target is not None:
+            # Measured off the Tk thread: a speed change has to be rendered once to be measured.
+            # Peaks are kept 1 dB below full scale.
+            segment = self.segment
+            self.analysis.submit('normalize', lambda job: normalization_gain(segment, target, peak_limit=-1.0, check=job.check),
+                                 lambda gain: self.apply_normalization(segment, gain))
+
+    @traced("normalize")
+    def apply_normalization(self, segment, gain):
+        if segment is not self.segment:
+            return  # Edited while it was being measured
+        before = self.state()
+        # Applied under speed, frequency and volume, so the volume slider still works from here
+        self.original_segment = self.original_segment + gain
+        self.apply_effects()
+        self.history.record(before, self.state())
+        self.update_engine()
+        self.update_waveform()
+
+    def state(self):
+        return {'original_segment': self.original_segment, 'speed': self.speed,
+                'frequency': self.frequency, 'volume': self.volume}
+
+    @traced("undo")
+    def undo(self, event=None):
+        if self.segment is not None and self.history.can_undo():
+            self.restore(self.history.undo(self.state()))
+
+    @traced("redo")
+    def redo(self, event=None):
+        if self.segment is not None and self.history.can_redo():
+            self.restore(self.history.redo(self.state()))
+
+    def restore(self, state):
+        # Versions share their nodes and samples, so switching is just swapping references
+        old_speed = self.speed
+        self.original_segment = state['original_segment']
+        self.speed = state['speed']
+        self.frequency = state['frequency']
+        self.volume = state['volume']
+        self.speed_var.set(f"{self.speed} x")
+        self.apply_effects()
+        self.update_engine(old_speed)
+        self.update_waveform()
+
+    def update_engine(self, old_speed=None):
+        # Playback picks up the new settings on its next block instead of restarting
+        if self.engine is None or not self.player.is_playing():
+            return
+        if old_speed is not None and old_speed != self.speed:
+            self.player.rebase(self.player.position_ms() * old_speed / self.speed)
+        self.engine.set_speed(self.speed)
+        self.engine.set_frequency(self.frequency)
+        self.engine.set_volume(self.volume)
+        self.playhead.duration = len(self.segment)
+
+    def slider_released(self, event):
+        if self.history is not None:
+            self.history.end_group()
+        self.update_waveform()
+
+    def update_waveform(self, preview=False):
+        # The envelope is computed off the Tk thread; a newer request cancels an older one
+        segment = self.segment
+        if segment is None:
+            return
+        if self.spectrogram_var.get():
+            self.spectrogram.show(segment)
+        bins = self.waveform.pixel_width()
+        if preview:
+            bins //= 8
+        self.worker.submit('waveform', lambda job: self.compute_envelope(segment, bins),
+                           lambda result: self.show_waveform(segment, result), delay_ms=30 if preview else 0)
+        # Answered from the block statistics of the sources, so cheap enough for every change;
+        # on the analysis thread, as the first measure after a speed change renders it
+        self.analysis.submit('loudness', lambda job: self.measure_loudness(segment, job.check), self.show_loudness,
+                             delay_ms=30 if preview else 0)
+
+    def measure_loudness(self, segment, check=None):
+        from loudness import measure
+        with span("loudness"):
+            return measure(segment, check=check)
+
+    def show_loudness(self, levels):
+        from loudness import describe
+        self.loudness_label.config(text=describe(levels))
+
+    def compute_envelope(self, segment, bins):
+        from waveform import envelope
+        with span("envelope", bins=bins):
+            return envelope(segment, 0, segment.frame_count, bins)
+
+    @traced("show_waveform")
+    def show_waveform(self, segment, result):
+        self.waveform.update(segment, *result)
+        self.canvas.draw_idle()
 
     def cut_dialog(self):
         if self.segment is not None:
-            start_time = simpledialog.askinteger("Input", "Enter start time (in milliseconds):", initialvalue=self.start_time)
-            end_time = simpledialog.askinteger("Input", "Enter end time (in milliseconds):", initialvalue=self.end_time)
+            start_time, end_time = self.start_time, self.end_time
+            for start, end in self.segments:
+                if start <= self.play_position < end:
+                    start_time, end_time = start, end  # Suggest the detected segment under the playhead
+            start_time = simpledialog.askinteger("Input", "Enter start time (in milliseconds):", initialvalue=start_time)
+            end_time = simpledialog.askinteger("Input", "Enter end time (in milliseconds):", initialvalue=end_time)
 
             if start_time is not None and end_time is not None:
+                # Before anything else is done to the file, the loader can cut past what is decoded so far
+                whole = self.original_segment is self.audio
+                duration = self.loader.duration() if whole else None if self.segment.growing else len(self.original_segment)
                 start_time = max(0, min(start_time, end_time))
-                end_time = max(start_time, min(end_time, len(self.segment)))
-                self.segment = self.segment[start_time:end_time]
-
-                self.update_waveform()  # Update the waveform without saving
-
-
-    def plot_waveform(self, audio_path):
-        wav_path = self.convert_to_wav(audio_path)
-        sample_rate, data = wavfile.read(wav_path)
-
-        # Create a time axis in milliseconds
-        duration = len(data) / sample_rate
-        time = np.linspace(0., duration, len(data)) * 1000  # Multiply by 1000 to convert to milliseconds
-
-        self.figure.clear()  # Clear the current plot
-        self.plot = self.figure.add_subplot(111)
-        self.plot.plot(time, data,color='gray')  # Plot data against time
+                if duration is not None:  # Unknown while another format decodes; the cut fills in as it does
+                    end_time = max(start_time, min(end_time, duration / self.speed))
+                with span("cut"):
+                    before = self.state()
+                    # Cut times are on the played-back timeline; map them back through the speed change
+                    if whole:
+                        self.original_segment = self.loader.range(start_time * self.speed, end_time * self.speed)
+                    else:
+                        self.original_segment = self.original_segment[start_time * self.speed:end_time * self.speed]
+                    self.apply_effects()
+                    self.history.record(before, self.state())
+
+                    self.update_waveform()  # Update the waveform without saving
+
+
+    def find_segments(self):
+        from silence import detect_segments
+        # Silence analysis runs off the Tk thread on the audio before speed, frequency and
+        # volume, so a speed change is never rendered for it; the threshold is moved by
+        # the volume change and the boundaries mapped through the speed change
+        if self.original_segment is None:
+            return
+        settings = (self.original_segment, self.speed, self.volume)
+        original, speed, volume = settings
+        self.analysis.submit('segments', lambda job: detect_segments(original, silence_thresh=-40 - volume, check=job.check),
+                             lambda result: self.show_segments(settings, result))
 
-        # Add a vertical line for the current position
-        self.current_position_line = self.plot.axvline(x=0, color='r')
+    def show_segments(self, settings, segments):
+        if settings != (self.original_segment, self.speed, self.volume):
+            return
+        speed = settings[1]
+        self.segments = [[round(start / speed), round(end / speed)] for start, end in segments]
+        self.waveform.set_markers(sorted({edge for bounds in self.segments for edge in bounds}))
+        self.canvas.draw_idle()
+
+    def save_segments(self):
+        from silence import segment_paths
+        # Each detected segment is written to its own file, encoded concurrently
+        if self.segment is None or not self.segments:
+            print("No segments found yet (Edit > Find segments).")
+            return
+        out_dir = filedialog.askdirectory()
+        if out_dir:
+            paths = segment_paths(self.audio_path, out_dir, len(self.segments), "mp3")
+            for (start, end), path in zip(self.segments, paths):
+                self.start_export([(path, "mp3", None)], self.segment[start:end])
+
+    def toggle_spectrogram(self):
+        # Shown next to the waveform; scroll to zoom, shift+scroll to move along the timeline
+        self.ensure_ready()
+        if self.spectrogram is None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from matplotlib.figure import Figure
+            from spectrogram import SpectrogramView
+            figure = Figure(figsize=(5, 4), dpi=100)
+            canvas = FigureCanvasTkAgg(figure, master=self.master)
+            self.spectrogram = SpectrogramView(self.master, canvas)
+        widget = self.spectrogram.canvas.get_tk_widget()
+        if self.spectrogram_var.get():
+            widget.grid(row=1, column=3)
+            if self.segment is not None:
+                self.spectrogram.show(self.segment)
+        else:
+            widget.grid_remove()
 
-        self.canvas.draw()
+    def toggle_tracing(self):
+        if self.trace_var.get():
+            tracer.enable()
+        else:
+            tracer.disable()
 
-    def convert_to_wav(self, audio_path):
-        audio = AudioSegment.from_file(audio_path)
-        wav_path = audio_path.rsplit('.', 1)[0] + '.wav'
-        audio.export(wav_path, format='wav')
-        return wav_path
+    def toggle_overlay(self):
+        if self.overlay_var.get():
+            self.trace_label.grid(row=6, column=0, columnspan=3, sticky='w')
+            self.update_overlay()
+        else:
+            self.trace_label.grid_remove()
 
-root = tk.Tk()
-audio_editor = AudioEditor(root)
-root.mainloop()
\ No newline at end of file
+    def update_overlay(self):
+        # Breakdown of the last traced operation, refreshed while the overlay is shown
+        if not self.overlay_var.get():
+            return
+        self.trace_label.config(text=tracer.breakdown() or "Nothing traced yet (Trace > Record).")
+        self.master.after(500, self.update_overlay)
+
+    def save_trace(self):
+        save_path = filedialog.asksaveasfilename(defaultextension=".json")
+        if save_path:
+            tracer.export_chrome(save_path)
+
+if __name__ == "__main__":
+    args = startup.parse_args()
+    root = tk.Tk()
+    audio_editor = AudioEditor(root)
+    if args.startup_time:
+        startup.measure(root, args.budget)
+    root.mainloop()
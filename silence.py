@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+
+def frame_energy(node, window_ms=20, hop_ms=10, block_seconds=60, check=None):
+    # Mean square of the channel-averaged signal over `window_ms` windows every `hop_ms`,
+    # one value per hop. The node is streamed in large blocks; within a block the
+    # per-hop sums come from one reshape and the windows from a cumulative sum, so
+    # there is no loop per frame. `check` is called before each block (see worker.Job).
+    hop = max(1, int(node.frame_rate * hop_ms / 1000))
+    per_window = max(1, round(window_ms / hop_ms))
+    block = max(hop, int(node.frame_rate * block_seconds) // hop * hop)
+    sums = []
+    leftover = np.zeros(0, dtype=np.float64)
+    for samples in node.stream(0, block):
+        if check is not None:
+            check()
+        squares = np.concatenate([leftover, np.square(samples, dtype=np.float64).mean(axis=1)])
+        whole = len(squares) // hop * hop
+        sums.append(squares[:whole].reshape(-1, hop).sum(axis=1))
+        leftover = squares[whole:]
+    if len(leftover):
+        sums.append(np.array([leftover.sum()]))
+    sums = np.concatenate(sums) if sums else np.zeros(0)
+    # Window i covers hops [i, i + per_window)
+    total = np.concatenate([[0.0], np.cumsum(sums)])
+    ends = np.minimum(np.arange(len(sums)) + per_window, len(sums))
+    return (total[ends] - total[:-1]) / np.maximum(1, (ends - np.arange(len(sums))) * hop), hop_ms
+
+
+def to_db(energy):
+    return 10 * np.log10(energy + 1e-12)
+
+
+def detect_silence(node, min_silence_len=500, silence_thresh=-40, window_ms=20, hop_ms=10, check=None):
+    # [start_ms, end_ms] ranges quieter than silence_thresh dBFS for at least
+    # min_silence_len ms, like pydub.silence.detect_silence
+    energy, hop_ms = frame_energy(node, window_ms, hop_ms, check=check)
+    quiet = np.concatenate([[False], to_db(energy) < silence_thresh, [False]])
+    edges = np.flatnonzero(np.diff(quiet.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]
+    keep = (ends - starts) * hop_ms >= min_silence_len
+    duration = len(node)
+    return [[int(start * hop_ms), int(min(end * hop_ms, duration))] for start, end in zip(starts[keep], ends[keep])]
+
+
+def detect_segments(node, min_silence_len=500, silence_thresh=-40, keep_silence=100, window_ms=20, hop_ms=10,
+                    check=None):
+    # [start_ms, end_ms] of the sound between silences, padded by keep_silence ms,
+    # like the chunks of pydub.silence.split_on_silence
+    silences = detect_silence(node, min_silence_len, silence_thresh, window_ms, hop_ms, check)
+    duration = len(node)
+    bounds = [0] + [edge for silence in silences for edge in silence] + [duration]
+    segments = []
+    for start, end in zip(bounds[0::2], bounds[1::2]):
+        if end > start:
+            segments.append([max(0, start - keep_silence), min(duration, end + keep_silence)])
+    return segments
+
+
+def segment_paths(path, out_dir, count, format):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return [os.path.join(out_dir, f"{stem}_{index + 1:03d}.{format}") for index in range(count)]
@@ -0,0 +1,186 @@
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def stft_columns(node, start, count, hop, size, window):
+    # Magnitude spectra in dBFS of `count` windows of `size` frames centred every `hop`
+    # frames from `start`; returns (size // 2 + 1, count)
+    first = start - size // 2
+    if hop >= 4 * size:
+        # Zoomed out: render only the frames under each window
+        frames = np.zeros((count, size), dtype=np.float32)
+        for column in range(count):
+            offset = first + column * hop
+            samples = node.render(max(0, offset), offset + size)
+            if len(samples):
+                frames[column, max(0, -offset):max(0, -offset) + len(samples)] = samples.mean(axis=1)
+    else:
+        length = (count - 1) * hop + size
+        samples = node.render(max(0, first), first + length)
+        mono = np.zeros(length, dtype=np.float32)
+        if len(samples):
+            mono[max(0, -first):max(0, -first) + len(samples)] = samples.mean(axis=1)
+        frames = np.lib.stride_tricks.sliding_window_view(mono, size)[::hop][:count]
+    spectrum = np.abs(np.fft.rfft(frames * window, axis=1)) / (window.sum() / 2)
+    return (20 * np.log10(spectrum + 1e-6)).astype(np.float32).T
+
+
+class TileCache:
+    # Least recently used tiles, bounded by their total size
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key):
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        if key in self.tiles:
+            self.bytes -= self.tiles.pop(key).nbytes
+        self.tiles[key] = tile
+        self.bytes += tile.nbytes
+        while self.bytes > self.max_bytes and len(self.tiles) > 1:
+            self.bytes -= self.tiles.popitem(last=False)[1].nbytes
+
+
+class SpectrogramView:
+    # Spectrogram split into tiles of `columns` STFT columns. A tile is keyed by the
+    # node it was computed from and its length (nodes never change otherwise, so
+    # together they are a buffer version), its zoom level (the hop doubles per level)
+    # and its index along the timeline. Missing tiles are computed on a thread pool;
+    # whatever is cached is drawn at once.
+    def __init__(self, master, canvas, size=1024, columns=256, min_hop=64, workers=None,
+                 max_bytes=256 * 1024 ** 2, poll_ms=30):
+        self.master = master
+        self.canvas = canvas
+        self.figure = canvas.figure
+        self.size = size
+        self.columns = columns
+        self.min_hop = min_hop
+        self.window = np.hanning(size + 1)[:-1].astype(np.float32)
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+        self.cache = TileCache(max_bytes)
+        self.results = queue.Queue()
+        self.futures = {}
+        self.poll_ms = poll_ms
+        self.node = None
+        self.frame_count = 0
+        self.view = (0, 0)
+        self.zoomed = False
+        self.axes = self.figure.add_subplot(1, 1, 1)
+        self.axes.set_xlabel("ms")
+        self.axes.set_ylabel("Hz")
+        self.image = None
+        canvas.mpl_connect('scroll_event', self.on_scroll)
+        self.master.after(self.poll_ms, self.poll)
+
+    def show(self, node):
+        # Keep a zoomed view across versions where it still fits, otherwise show everything
+        if node is self.node and node.frame_count == self.frame_count:
+            return
+        self.node = node
+        self.frame_count = node.frame_count  # A source that is still decoding changes length
+        for key, future in list(self.futures.items()):
+            if key[0] is not node and future.cancel():
+                del self.futures[key]
+        start, end = self.view
+        if not self.zoomed or start >= len(node):
+            start, end = 0, len(node)
+        self.set_view(start, end)
+
+    def level_for(self, start, end):
+        width = max(1, int(self.axes.bbox.width))
+        hop = (end - start) / width
+        return max(0, int(np.ceil(np.log2(max(hop, 1) / self.min_hop))))
+
+    def set_view(self, start_ms, end_ms):
+        node = self.node
+        self.view = (start_ms, end_ms)
+        if node is None or end_ms <= start_ms:
+            return
+        start = node.ms_to_frame(start_ms)
+        end = max(start + 1, int(end_ms * node.frame_rate / 1000))
+        level = self.level_for(start, end)
+        hop = self.min_hop * 2 ** level
+        span = self.columns * hop
+        first, last = start // span, -(-end // span)
+        bins = self.size // 2 + 1
+        data = np.full((bins, (last - first) * self.columns), np.nan, dtype=np.float32)
+        for index in range(first, last):
+            key = (node, node.frame_count, level, index)
+            tile = self.cache.get(key)
+            if tile is None:
+                self.request(key)
+            else:
+                data[:, (index - first) * self.columns:(index - first + 1) * self.columns] = tile
+        self.draw(data, first * span * 1000 / node.frame_rate, last * span * 1000 / node.frame_rate,
+                  node.frame_rate / 2)
+        self.axes.set_xlim(start_ms, end_ms)
+        self.canvas.draw_idle()
+
+    def draw(self, data, start_ms, end_ms, nyquist):
+        extent = (start_ms, end_ms, 0, nyquist)
+        if self.image is None:
+            self.image = self.axes.imshow(data, origin='lower', aspect='auto', extent=extent,
+                                          cmap='magma', vmin=-100, vmax=0, interpolation='nearest')
+        else:
+            self.image.set_data(data)
+            self.image.set_extent(extent)
+        self.axes.set_ylim(0, nyquist)
+
+    def request(self, key):
+        if key in self.futures:
+            return
+        node, _, level, index = key
+        hop = self.min_hop * 2 ** level
+        self.futures[key] = self.pool.submit(self.compute, key, node, index * self.columns * hop, hop)
+
+    def compute(self, key, node, start, hop):
+        try:
+            self.results.put((key, stft_columns(node, start, self.columns, hop, self.size, self.window)))
+        except Exception as e:
+            print(f"Spectrogram tile failed: {e}")
+            self.results.put((key, None))
+
+    def poll(self):
+        # Finished tiles go into the cache on the Tk thread; redraw if any is for this version
+        arrived = False
+        while True:
+            try:
+                key, tile = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.futures.pop(key, None)
+            if tile is not None:
+                self.cache.put(key, tile)
+                arrived = arrived or key[0] is self.node
+        if arrived:
+            self.set_view(*self.view)
+        self.master.after(self.poll_ms, self.poll)
+
+    def on_scroll(self, event):
+        # Wheel zooms around the pointer; with shift held it scrolls along the timeline
+        if self.node is None or event.xdata is None:
+            return
+        start, end = self.view
+        width = end - start
+        if event.key == 'shift':
+            shift = -width * 0.2 * event.step
+            start, end = start + shift, end + shift
+        else:
+            scale = 0.8 ** event.step
+            start = event.xdata - (event.xdata - start) * scale
+            end = start + width * scale
+        duration = len(self.node)
+        width = min(end - start, duration)
+        start = max(0, min(start, duration - width))
+        self.zoomed = width < duration
+        self.set_view(start, start + max(width, 1))
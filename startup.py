@@ -0,0 +1,69 @@
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+
+STARTED = time.perf_counter()
+marks = {}
+
+
+def process_age_ms():
+    # Milliseconds since the process was created, so interpreter start-up counts too;
+    # falls back to the time since this module was imported
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return (uptime - started) * 1000
+    except (OSError, ValueError, IndexError):
+        return (time.perf_counter() - STARTED) * 1000
+
+
+def mark(name):
+    marks.setdefault(name, process_age_ms())
+
+
+class Warmup:
+    # Imports modules on a background thread so whoever needs them first finds them
+    # in sys.modules. Import errors are left for that first use to raise.
+    def __init__(self, modules):
+        self.thread = threading.Thread(target=self.run, args=(modules,), daemon=True)
+        self.thread.start()
+
+    def run(self, modules):
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except Exception:
+                return
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    def wait(self):
+        self.thread.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Audio editor")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print the time to first paint and until playback and plotting are ready, then exit")
+    parser.add_argument("--budget", type=float, default=300, help="time to first paint allowed, in ms")
+    return parser.parse_args(argv)
+
+
+def measure(master, budget_ms, poll_ms=10):
+    # Reports once the editor has marked "first paint" and "ready", then closes the
+    # window; the exit status is 1 when first paint is over budget
+    if "ready" not in marks:
+        master.after(poll_ms, measure, master, budget_ms, poll_ms)
+        return
+    paint = marks["first paint"]
+    print(f"First paint after {paint:.0f} ms (budget {budget_ms:.0f} ms), ready after {marks['ready']:.0f} ms")
+    if paint > budget_ms:
+        print("Start-up is over budget.")
+    master.destroy()
+    sys.exit(1 if paint > budget_ms else 0)
@@ -0,0 +1,250 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+
+import dsp
+from edits import Source
+from loudness import BlockStats
+from tracing import span
+from waveform import PeakPyramid
+
+RANGE_DECODE_MS = 30000  # Longest range decoded on the spot rather than waited for
+
+
+def probe(path):
+    # Sample rate and channel count of the first audio stream
+    for stream in mediainfo_json(path).get("streams", []):
+        if stream.get("codec_type") == "audio":
+            return int(stream["sample_rate"]), int(stream["channels"])
+    raise ValueError(f"No audio stream in {path}")
+
+
+def decode_chunks(path, frame_rate, channels, chunk_frames, offset=None):
+    # Decode through an ffmpeg pipe, yielding (frames, channels) int16 arrays as they arrive.
+    # With `offset` the file is read from that byte on as a bare MP3 stream (see seekindex).
+    if offset is None:
+        stdin, source = subprocess.DEVNULL, ["-i", path]
+    else:
+        stdin, source = open(path, "rb"), ["-f", "mp3", "-i", "pipe:0"]
+        stdin.seek(offset)
+    command = [AudioSegment.converter, "-v", "error"] + source + ["-f", "s16le", "-acodec", "pcm_s16le",
+                                                                   "-ac", str(channels), "-ar", str(frame_rate), "-"]
+    process = subprocess.Popen(command, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frame_size = 2 * channels
+    leftover = b""
+    try:
+        while True:
+            data = process.stdout.read(chunk_frames * frame_size)
+            if not data:
+                break
+            data = leftover + data
+            usable = len(data) // frame_size * frame_size
+            leftover = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, channels)
+        if process.wait() != 0:
+            raise RuntimeError(f"Decoding {path} failed: {process.stderr.read().decode(errors='replace').strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        if stdin is not subprocess.DEVNULL:
+            stdin.close()
+        process.stdout.close()
+        process.stderr.close()
+
+
+class SampleFile:
+    # Append-only sample store on disk. Reads go through the file, so memory use does
+    # not grow with the recording; only the chunk being appended is held. One file
+    # object is shared by the decode thread and readers, so each seek and its read or
+    # write happen under the lock.
+    ndim = 2
+
+    def __init__(self, path, channels, dtype=np.int16):
+        self.path = path
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.frame_size = self.dtype.itemsize * channels
+        self.file = open(path, "w+b")
+        self.lock = threading.Lock()
+        self.length = 0
+
+    @property
+    def shape(self):
+        return (self.length, self.channels)
+
+    def __len__(self):
+        return self.length
+
+    def append(self, samples):
+        data = samples.astype(self.dtype, copy=False).tobytes()
+        with self.lock:
+            self.file.seek(self.length * self.frame_size)
+            self.file.write(data)
+            self.length += len(samples)
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(self.length)
+        count = max(0, stop - start)
+        if not count:
+            return np.zeros((0, self.channels), dtype=self.dtype)
+        with self.lock:
+            self.file.seek(start * self.frame_size)
+            data = self.file.read(count * self.frame_size)
+        return np.frombuffer(data, dtype=self.dtype).reshape(-1, self.channels)
+
+    def move(self, path):
+        # Rename the finished file, closed while it is renamed (Windows will not rename
+        # an open file) and reopened for reading at its new path
+        with self.lock:
+            self.file.close()
+            os.replace(self.path, path)
+            self.path = path
+            self.file = open(path, "rb")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def __del__(self):
+        self.close()  # Kept open for reading for as long as the source using it is alive
+
+
+class StreamingSource(Source):
+    # A source that grows while its file is decoded in the background. Everything
+    # decoded so far can be drawn, edited and played; nodes built on top of it
+    # follow its length as it grows (see Node.growing).
+    def __init__(self, samples, frame_rate):
+        super().__init__(samples, frame_rate, 2, pyramid=PeakPyramid(samples, frame_rate))
+        self.stats = BlockStats(frame_rate, self.channels, self.render)
+        self.complete = threading.Event()
+
+    @property
+    def growing(self):
+        return not self.complete.is_set()
+
+    def append(self, samples):
+        self.samples.append(samples)
+        self.pyramid.extend(samples)
+        self.stats.extend(dsp.to_float(samples, self.sample_width))
+        self.frame_count += len(samples)  # Last, so readers never see frames before they are written
+
+    def stream(self, start, frames, stopped=None):
+        # Playback that reaches the decoded end waits for more instead of stopping,
+        # until decoding finishes or `stopped` says the reader has gone
+        position = max(0, start)
+        while True:
+            available = self.frame_count
+            if position < available:
+                end = min(position + frames, available)
+                yield self.render(position, end)
+                position = end
+            elif self.complete.is_set():
+                if position >= self.frame_count:  # Frames may have landed just before completion
+                    return
+            elif stopped is not None and stopped():
+                return
+            else:
+                time.sleep(0.02)
+
+
+class StreamingLoader:
+    # Open a file through the decode cache. A cached file opens at once; otherwise it is
+    # decoded `chunk_seconds` at a time into a StreamingSource, and stored in the cache
+    # when decoding finishes. Files not seen before are hashed for their cache key on
+    # the decode thread, so opening never reads the whole file first.
+    def __init__(self, cache, path, chunk_seconds=1.0):
+        self.cache = cache
+        self.path = path
+        self.chunk_seconds = chunk_seconds
+        self.error = None
+        self.index = None
+        self.key = cache.known_key(path)
+        meta = cache.lookup(self.key) if self.key else None
+        if meta is not None:
+            self.source = cache.open(self.key, meta)
+            self.thread = None
+            return
+        frame_rate, channels = probe(path)
+        fd, self.temp = tempfile.mkstemp(dir=cache.directory, suffix=".tmp")
+        os.close(fd)
+        self.source = StreamingSource(SampleFile(self.temp, channels), frame_rate)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def done(self):
+        return self.thread is None or not self.thread.is_alive()
+
+    def wait(self):
+        # For edits that need the final length of the file
+        self.source.complete.wait()
+
+    def seek_index(self):
+        # For reaching parts of an MP3 the background decode has not got to yet
+        if self.index is None and self.path.lower().endswith(".mp3"):
+            try:
+                if self.key is None:
+                    from seekindex import SeekIndex  # seekindex imports this module
+                    self.index = SeekIndex.build(self.path)  # Not hashed yet; that is left to the decode thread
+                else:
+                    self.index = self.cache.seek_index(self.path, self.key)
+            except ValueError as e:
+                print(f"Error indexing {self.path}: {e}")
+        return self.index
+
+    def decoded(self, end_ms):
+        return self.done() or end_ms * self.source.frame_rate / 1000 <= self.source.frame_count
+
+    def duration(self):
+        # Length of the whole file in ms, known from the seek index before decoding
+        # finishes; None while another format is still being decoded
+        if self.done():
+            return len(self.source)
+        if self.seek_index() is not None:
+            return round(self.index.frame_count * 1000 / self.index.frame_rate)
+        return None
+
+    def range(self, start_ms, end_ms):
+        # The file between two times. Past the decoded part of an MP3 a short range is
+        # decoded now from just the frames covering it, trimmed to the exact samples;
+        # a longer one is a slice of the source that fills in as the decode gets there,
+        # so memory use stays bounded and the Tk thread is not held up.
+        if self.decoded(end_ms) or end_ms - start_ms > RANGE_DECODE_MS or self.seek_index() is None:
+            return self.source[start_ms:end_ms]
+        return self.index.source(start_ms, end_ms)
+
+    def playable(self, start_ms):
+        # What to play from `start_ms`: the decoded samples, or the MP3 itself from the
+        # frames around there if the decode has not reached it
+        if self.decoded(start_ms) or self.seek_index() is None:
+            return self.source
+        return self.index.node()
+
+    def run(self):
+        source = self.source
+        try:
+            chunk_frames = max(1, int(source.frame_rate * self.chunk_seconds))
+            with span("decode.stream", path=self.path) as decoding:
+                for samples in decode_chunks(self.path, source.frame_rate, source.channels, chunk_frames):
+                    source.append(samples)
+                    decoding.add_bytes(samples.nbytes)
+            self.key = self.key or self.cache.key(self.path)
+            source.samples.move(self.cache.path(self.key, ".pcm"))
+            self.cache.commit(self.key, source.samples.path, source.frame_rate, source.channels,
+                              source.sample_width, source.frame_count, source.pyramid, source.stats)
+        except Exception as e:
+            self.error = e
+            try:
+                os.remove(self.temp)  # Already open for reading, so the decoded prefix stays playable
+            except OSError:
+                pass  # Still open on Windows; the cache removes it once it is stale
+            print(f"Error decoding {self.path}: {e}")
+        finally:
+            source.complete.set()
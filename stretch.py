@@ -0,0 +1,102 @@
+import numpy as np
+
+
+class TimeStretcher:
+    # Streaming phase vocoder: analysis frames are taken every `speed * hop` input
+    # frames and written every `hop` output frames, so duration changes while pitch
+    # does not. Blocks of any size can be pushed through process().
+    def __init__(self, speed, frame_rate, channels, frame_size=None):
+        if frame_size is None:
+            frame_size = 2 ** int(round(np.log2(frame_rate * 0.046)))  # 2048 at 44.1 kHz
+        self.speed = speed
+        self.channels = channels
+        self.size = frame_size
+        self.hop = frame_size // 4
+        self.window = np.hanning(frame_size + 1)[:-1].astype(np.float32)[None, :, None]
+        self.expected = (2 * np.pi * self.hop / frame_size * np.arange(frame_size // 2 + 1))[None, :, None]
+        # Half a frame of leading silence centres the first frame on the first sample
+        self.buffer = np.zeros((frame_size // 2, channels), dtype=np.float32)
+        self.position = 0.0
+        self.phase = None
+        self.tail = np.zeros((frame_size - self.hop, channels), dtype=np.float32)
+        self.skip = frame_size // 2
+        self.received = 0
+        self.produced = 0
+
+    def process(self, samples):
+        self.received += len(samples)
+        self.buffer = np.concatenate([self.buffer, samples.astype(np.float32, copy=False)])
+        return self.run()
+
+    def flush(self):
+        remaining = max(0, round(self.received / self.speed) - self.produced)
+        padding = np.zeros((self.size * 2 + int(self.hop * self.speed) + 1, self.channels), dtype=np.float32)
+        self.buffer = np.concatenate([self.buffer, padding])
+        return np.concatenate([self.run(), self.tail])[:remaining]
+
+    def run(self):
+        size, hop = self.size, self.hop
+        analysis_hop = self.speed * hop
+        last = len(self.buffer) - size - hop  # Each frame also reads the frame one hop ahead
+        if last < self.position:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        count = int((last - self.position) // analysis_hop) + 1
+        starts = np.round(self.position + np.arange(count) * analysis_hop).astype(np.int64)
+        index = starts[:, None] + np.arange(size)[None, :]
+        spectrum = np.fft.rfft(self.buffer[index] * self.window, axis=1)
+        ahead = np.fft.rfft(self.buffer[index + hop] * self.window, axis=1)
+
+        # Measured phase advance over one hop, unwrapped around the bin's own frequency
+        advance = np.angle(ahead) - np.angle(spectrum) - self.expected
+        advance -= 2 * np.pi * np.round(advance / (2 * np.pi))
+        advance += self.expected
+        if self.phase is None:
+            self.phase = np.angle(spectrum[0])
+        total = np.cumsum(advance, axis=0)
+        phase = self.phase + np.concatenate([np.zeros_like(total[:1]), total[:-1]])
+        self.phase = np.mod(self.phase + total[-1], 2 * np.pi)
+
+        magnitude = np.abs(spectrum)
+        phase = self.lock(phase, magnitude, np.angle(spectrum))
+        frames = np.fft.irfft(magnitude * np.exp(1j * phase), n=size, axis=1).astype(np.float32)
+        frames *= self.window / 1.5  # Squared Hann windows at 75% overlap sum to 1.5
+        out = np.zeros(((count - 1) * hop + size, self.channels), dtype=np.float32)
+        out[:size - hop] += self.tail
+        for part in range(size // hop):
+            out[part * hop:part * hop + count * hop] += frames[:, part * hop:(part + 1) * hop].reshape(-1, self.channels)
+        self.tail = out[count * hop:]
+        out = out[:count * hop]
+
+        self.position += count * analysis_hop
+        consumed = int(self.position)
+        self.buffer = self.buffer[consumed:]
+        self.position -= consumed
+        if self.skip:
+            dropped = min(self.skip, len(out))
+            out = out[dropped:]
+            self.skip -= dropped
+        self.produced += len(out)
+        return out
+
+
+    def lock(self, phase, magnitude, analysis):
+        # Identity phase locking: bins around each spectral peak keep their analysed phase
+        # relative to the peak, which keeps partials coherent instead of smeared
+        bins = np.arange(magnitude.shape[1])[None, :, None]
+        peak = np.zeros(magnitude.shape, dtype=bool)
+        peak[:, 1:-1] = (magnitude[:, 1:-1] > magnitude[:, :-2]) & (magnitude[:, 1:-1] >= magnitude[:, 2:])
+        missing = magnitude.shape[1] * 2
+        before = np.maximum.accumulate(np.where(peak, bins, -missing), axis=1)
+        after = np.minimum.accumulate(np.where(peak, bins, missing)[:, ::-1], axis=1)[:, ::-1]
+        owner = np.where(bins - before <= after - bins, before, after)
+        owner = np.where(np.abs(owner - bins) < missing // 2, owner, bins)
+        return (np.take_along_axis(phase, owner, axis=1) + analysis
+                - np.take_along_axis(analysis, owner, axis=1))
+
+
+def time_stretch(samples, speed, frame_rate):
+    # Whole-buffer stretch; the result is len(samples) / speed frames long
+    if speed == 1:
+        return samples
+    stretcher = TimeStretcher(speed, frame_rate, samples.shape[1])
+    return np.concatenate([stretcher.process(samples), stretcher.flush()])
@@ -1,5 +1,6 @@
 from pydub import AudioSegment
 import pydub.playback
+from edits import Source
 
 # Load the MP3 audio file
 audio = AudioSegment.from_mp3("new1.mp3")
@@ -7,9 +8,8 @@ audio = AudioSegment.from_mp3("new1.mp3")
 # Define the speed multiplier for slowing down
 speed_multiplier = 0.5  # For example, slow down by 0.5 times
 
-# Adjust the frame rate to change the speed (slowing down)
-new_frame_rate = int(audio.frame_rate * speed_multiplier)
-slowed_audio = audio.set_frame_rate(new_frame_rate)
+# Stretch the audio in time without changing its pitch
+slowed_audio = Source.from_segment(audio).speedup(playback_speed=speed_multiplier).to_segment()
 
 # Play the modified audio
 pydub.playback.play(slowed_audio)
@@ -0,0 +1,196 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def max_rss_bytes():
+    # Peak resident memory of the process; 0 where the resource module is missing (Windows)
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+class NullSpan:
+    # Returned while tracing is off so instrumented code pays for one attribute check
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, count):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.parent = None
+        self.children = []
+        self.bytes = 0
+        self.memory = 0  # Peak traced allocation above the start, when tracemalloc is on
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        if stack:
+            self.parent = stack[-1]
+            self.parent.children.append(self)
+        stack.append(self)
+        self.thread = threading.get_ident()
+        self.rss = max_rss_bytes()
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.fold(peak)
+            tracemalloc.reset_peak()
+            self.base = self.peak = current
+        self.cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.thread_time() - self.cpu_start
+        self.rss_growth = max_rss_bytes() - self.rss
+        if tracemalloc.is_tracing() and hasattr(self, "base"):
+            self.fold(tracemalloc.get_traced_memory()[1])
+            self.memory = self.peak - self.base
+            if self.parent is not None:
+                self.parent.fold(self.peak)
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.tracer.finish(self)
+        return False
+
+    def fold(self, peak):
+        if hasattr(self, "peak"):
+            self.peak = max(self.peak, peak)
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+    def event(self, origin, pid):
+        # Chrome trace "complete" event; times are in microseconds
+        return {
+            "name": self.name, "ph": "X", "pid": pid, "tid": self.thread,
+            "ts": (self.start - origin) * 1e6, "dur": self.wall * 1e6,
+            "args": dict(self.args, cpu_ms=self.cpu * 1000, bytes=self.bytes,
+                         peak_alloc_mb=self.memory / 1024 ** 2, rss_growth_mb=self.rss_growth / 1024 ** 2),
+        }
+
+
+class Tracer:
+    # Nested timing spans per thread. Finished spans are kept in a bounded buffer and
+    # can be written as Chrome trace JSON (chrome://tracing or ui.perfetto.dev).
+    def __init__(self, enabled=False, memory=False, limit=100000):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+        self.spans = deque(maxlen=limit)
+        self.last = None  # Most recently finished top-level span
+        if enabled:
+            self.enable(memory)
+
+    def enable(self, memory=False):
+        # memory=True also tracks allocation peaks with tracemalloc, which slows Python code down
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def stack(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def current(self):
+        if not self.enabled:
+            return NULL_SPAN
+        stack = self.stack()
+        return stack[-1] if stack else NULL_SPAN
+
+    def add_bytes(self, count):
+        self.current().add_bytes(count)
+
+    def finish(self, span):
+        self.spans.append(span)
+        if span.parent is None:
+            self.last = span
+
+    def clear(self):
+        self.spans.clear()
+        self.last = None
+
+    def export_chrome(self, path):
+        pid = os.getpid()
+        with open(path, "w") as f:
+            json.dump({"traceEvents": [span.event(self.origin, pid) for span in list(self.spans)],
+                       "displayTimeUnit": "ms"}, f)
+
+    def breakdown(self, span=None):
+        # Text tree of a top-level span and its stages, for the overlay
+        span = span or self.last
+        if span is None:
+            return ""
+        lines = []
+
+        def add(span, depth):
+            text = f"{'  ' * depth}{span.name}: {span.wall * 1000:.1f} ms wall, {span.cpu * 1000:.1f} ms CPU"
+            if span.bytes:
+                text += f", {span.bytes / 1024 ** 2:.1f} MB"
+            if span.memory:
+                text += f", peak +{span.memory / 1024 ** 2:.1f} MB"
+            lines.append(text)
+            for child in span.children:
+                add(child, depth + 1)
+
+        add(span, 0)
+        return "\n".join(lines)
+
+
+tracer = Tracer(enabled=os.environ.get("AUDIO_EDITOR_TRACE", "") not in ("", "0"),
+                memory=os.environ.get("AUDIO_EDITOR_TRACE") == "memory")
+span = tracer.span
+add_bytes = tracer.add_bytes
+
+
+def traced(name=None):
+    # Decorator form of span(); the wrapped call is made directly while tracing is off
+    def decorate(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with Span(tracer, label, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,202 @@
+import numpy as np
+
+
+def segment_samples(segment):
+    # View the samples of an AudioSegment as a (frames, channels) array
+    samples = segment.get_array_of_samples()
+    return np.frombuffer(samples, dtype=samples.typecode).reshape(-1, segment.channels)
+
+
+def grow(array, start, rows):
+    # Write rows at `start`, doubling the allocation when it runs out so appends stay amortised O(1)
+    end = start + len(rows)
+    if end > len(array):
+        grown = np.empty((max(end, 2 * len(array)),) + array.shape[1:], dtype=array.dtype)
+        grown[:start] = array[:start]
+        array = grown
+    array[start:end] = rows
+    return array
+
+
+class PeakPyramid:
+    def __init__(self, samples, frame_rate, block=256, factor=4, levels=None):
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.channels = samples.shape[1]
+        self.frame_count = 0
+        self.block = block
+        self.factor = factor
+        self.levels = []  # (frames per entry, mins, maxs), finest first
+        self.storage = []  # [mins, maxs, entries, complete entries] per level, with spare capacity
+        self.tail = samples[:0]  # Frames after the last complete block
+        if levels is None:
+            self.extend(samples[:])
+        else:
+            self.levels = levels
+            self.frame_count = len(samples)
+
+    @classmethod
+    def load(cls, path, samples, frame_rate):
+        with np.load(path) as data:
+            levels = [(int(size), data[f"mins{i}"], data[f"maxs{i}"]) for i, size in enumerate(data["sizes"])]
+        block = levels[0][0] if levels else 256
+        return cls(samples, frame_rate, block=block, levels=levels)
+
+    def save(self, path):
+        arrays = {"sizes": np.array([size for size, _, _ in self.levels], dtype=np.int64)}
+        for i, (size, mins, maxs) in enumerate(self.levels):
+            arrays[f"mins{i}"] = mins
+            arrays[f"maxs{i}"] = maxs
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def extend(self, samples):
+        # Summarise frames appended to the end of self.samples. The last entry of each
+        # level may cover a partial block; it is recomputed when more frames arrive.
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+        tail = np.concatenate([self.tail, samples]) if len(self.tail) else samples
+        if len(tail) == 0:
+            return
+        complete = len(tail) // self.block
+        mins = np.minimum.reduceat(tail, np.arange(0, len(tail), self.block), axis=0)
+        maxs = np.maximum.reduceat(tail, np.arange(0, len(tail), self.block), axis=0)
+        level = 0
+        while True:
+            if level == len(self.storage):
+                empty = np.zeros((0, self.channels), dtype=mins.dtype)
+                self.storage.append([empty, empty, 0, 0])
+            entry = self.storage[level]
+            first = entry[3]
+            entry[0] = grow(entry[0], first, mins)
+            entry[1] = grow(entry[1], first, maxs)
+            entry[2], entry[3] = first + len(mins), first + complete
+            if entry[2] <= self.factor:
+                break
+            # Regroup the next level from its first incomplete entry onwards
+            start = self.storage[level + 1][3] * self.factor if level + 1 < len(self.storage) else 0
+            starts = np.arange(0, entry[2] - start, self.factor)
+            mins = np.minimum.reduceat(entry[0][start:entry[2]], starts, axis=0)
+            maxs = np.maximum.reduceat(entry[1][start:entry[2]], starts, axis=0)
+            complete = (entry[3] - start) // self.factor
+            level += 1
+        self.tail = tail[len(tail) // self.block * self.block:].copy()
+        self.levels = [(self.block * self.factor ** i, mins[:count], maxs[:count])
+                       for i, (mins, maxs, count, _) in enumerate(self.storage)]
+        self.frame_count += len(samples)
+
+    def peaks(self, start, end, bins):
+        # Min/max envelope of frames [start, end) reduced to at most `bins` columns
+        start = max(0, min(start, self.frame_count))
+        end = max(start, min(end, self.frame_count))
+        bins = max(1, int(bins))
+        per_bin = (end - start) / bins
+        size, mins, maxs = 1, self.samples, self.samples
+        for level in self.levels:
+            if level[0] > per_bin:
+                break
+            size, mins, maxs = level
+        first = start // size
+        last = -(-end // size)
+        mins, maxs = mins[first:last], maxs[first:last]
+        if len(mins) == 0:
+            empty = np.zeros((0, self.channels), dtype=self.samples.dtype)
+            return np.zeros(0, dtype=np.int64), empty, empty
+        if len(mins) > bins:
+            edges = np.unique(np.linspace(0, len(mins), bins, endpoint=False).astype(np.int64))
+            mins = np.minimum.reduceat(mins, edges, axis=0)
+            maxs = np.maximum.reduceat(maxs, edges, axis=0)
+        else:
+            edges = np.arange(len(mins))
+        positions = (first + edges) * size
+        positions[0] = max(positions[0], start)
+        return positions, mins, maxs
+
+
+def envelope(source, start, end, bins):
+    # Interleave mins and maxs so a single line sweeps each pixel column top to bottom
+    positions, mins, maxs = source.peaks(start, end, bins)
+    times = np.repeat(positions * 1000.0 / source.frame_rate, 2)
+    values = np.empty((len(positions) * 2, mins.shape[1]), dtype=mins.dtype)
+    values[0::2] = mins
+    values[1::2] = maxs
+    return times, values
+
+
+class WaveformView:
+    def __init__(self, figure, color=None):
+        self.figure = figure
+        self.color = color
+        self.source = None
+        self.axes = []
+        self.lines = []
+        self.cursors = []
+        self.markers = []  # Segment boundaries in milliseconds
+        self.marker_lines = []
+
+    def pixel_width(self):
+        return max(1, int(self.figure.bbox.width))
+
+    def show(self, source):
+        self.setup(source)
+        self.set_view(0, self.duration_ms())
+
+    def update(self, source, times, values):
+        # Show an envelope computed elsewhere, keeping the axes when the layout allows it
+        if source.channels != len(self.axes):
+            self.setup(source)
+        self.source = source
+        self.show_envelope(times, values)
+        if self.duration_ms() > 0:
+            self.axes[0].set_xlim(0, self.duration_ms())
+
+    def setup(self, source):
+        self.source = source
+        self.figure.clear()
+        self.axes, self.lines, self.cursors = [], [], []
+        for channel in range(source.channels):
+            sharex = self.axes[0] if self.axes else None
+            ax = self.figure.add_subplot(source.channels, 1, channel + 1, sharex=sharex)
+            line, = ax.plot([], [], color=self.color, linewidth=0.8)
+            self.axes.append(ax)
+            self.lines.append(line)
+            # Add a vertical line for the current position
+            self.cursors.append(ax.axvline(x=0, color='r', animated=True))
+        self.marker_lines = []
+        self.set_markers(self.markers)
+
+    def duration_ms(self):
+        if self.source is None:
+            return 0
+        return self.source.frame_count * 1000.0 / self.source.frame_rate
+
+    def set_view(self, start_ms, end_ms, bins=None):
+        if self.source is None:
+            return
+        start = int(start_ms * self.source.frame_rate / 1000)
+        end = int(np.ceil(end_ms * self.source.frame_rate / 1000))
+        times, values = envelope(self.source, start, end, bins or self.pixel_width())
+        self.show_envelope(times, values)
+        if end_ms > start_ms:
+            self.axes[0].set_xlim(start_ms, end_ms)
+
+    def show_envelope(self, times, values):
+        for channel, (ax, line) in enumerate(zip(self.axes, self.lines)):
+            line.set_data(times, values[:, channel])
+            if len(values):
+                low, high = float(values[:, channel].min()), float(values[:, channel].max())
+                margin = (high - low) * 0.05 or 1
+                ax.set_ylim(low - margin, high + margin)
+
+    def set_cursor(self, position_ms):
+        for cursor in self.cursors:
+            cursor.set_xdata([position_ms, position_ms])
+
+    def set_markers(self, markers):
+        for line in self.marker_lines:
+            line.remove()
+        self.markers = list(markers)
+        self.marker_lines = [ax.axvline(x=ms, color='g', linestyle='--', linewidth=0.8)
+                             for ax in self.axes for ms in self.markers]
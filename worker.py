@@ -0,0 +1,77 @@
+import queue
+import threading
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, function, callback):
+        self.function = function
+        self.callback = callback
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check(self):
+        # Long-running job functions call this between steps to give up early
+        if self.cancelled.is_set():
+            raise Cancelled()
+
+
+class BackgroundWorker:
+    def __init__(self, master, poll_ms=15):
+        self.master = master
+        self.poll_ms = poll_ms
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = {}  # key -> after id of a debounced job not yet queued
+        self.latest = {}  # key -> most recently submitted job
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.master.after(self.poll_ms, self.poll)
+
+    def submit(self, key, function, callback, delay_ms=0):
+        # A newer job for the same key replaces a pending one and cancels a running one
+        if key in self.pending:
+            self.master.after_cancel(self.pending.pop(key))
+        if key in self.latest:
+            self.latest[key].cancel()
+        job = Job(function, callback)
+        self.latest[key] = job
+        if delay_ms:
+            self.pending[key] = self.master.after(delay_ms, self.start, key, job)
+        else:
+            self.start(key, job)
+        return job
+
+    def start(self, key, job):
+        self.pending.pop(key, None)
+        self.jobs.put(job)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job.cancelled.is_set():
+                continue
+            try:
+                result = job.function(job)
+            except Cancelled:
+                continue
+            except Exception as e:
+                print(f"Background job failed: {e}")
+                continue
+            self.results.put((job, result))
+
+    def poll(self):
+        # Results are handed back on the Tk thread; stale ones are dropped
+        while True:
+            try:
+                job, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if not job.cancelled.is_set():
+                job.callback(result)
+        self.master.after(self.poll_ms, self.poll)